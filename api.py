@@ -0,0 +1,217 @@
+"""JSON API module for the Learning Journal app.
+
+A read-only API for entries, users and tags, under /api/.  Listings are paged
+by keyset cursors (pass a response's "next" value back as the "after"
+argument), and return only the fields asked for with the "fields" argument
+(e.g. ?fields=id,title,date).  Entries are visible under the same rules as
+the site's listings; the contents of entries the user may not read are null.
+"""
+
+import datetime
+
+from flask import Blueprint, jsonify, request
+from flask_login import current_user
+
+import models
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Fields which may be requested, and the columns which provide them.
+ENTRY_FIELDS = {
+    "id": models.Entry.id,
+    "title": models.Entry.title,
+    "date": models.Entry.date,
+    "username": models.User.username,
+    "time_spent": models.Entry.time_spent,
+    "learned": models.Entry.learned,
+    "resources": models.Entry.resources,
+    "tags": models.Entry.tags,
+    "private": models.Entry.private,
+    "hidden": models.Entry.hidden,
+}
+# Fields which are null for entries the user may not read.
+CONTENT_FIELDS = ["time_spent", "learned", "resources", "tags"]
+DEFAULT_ENTRY_FIELDS = ["id", "title", "date", "username"]
+USER_FIELDS = {
+    "id": models.User.id,
+    "username": models.User.username,
+}
+TAG_FIELDS = {
+    "id": models.Tag.id,
+    "name": models.Tag.name,
+}
+
+
+class APIError(Exception):
+    """An error to report to the client, with its HTTP status code."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def api_error(error):
+    return jsonify(error=error.message), error.status
+
+
+# Routes.
+@api.route("/entries")
+def entries():
+    """Lists the entries visible to the user (as on the home page)."""
+    return entry_page(models.Entry.visible_to(current_user))
+
+
+@api.route("/users/<username>/entries")
+def user_entries(username):
+    """Lists a user's entries visible to the user (as on their page)."""
+    return entry_page(models.Entry.visible_to(current_user) &
+                      (models.User.username == username))
+
+
+@api.route("/tags/<tag>/entries")
+def tag_entries(tag):
+    """Lists the entries with the tag visible to the user (as on the tag's
+        page).
+    """
+    return entry_page(models.Entry.visible_to(current_user) &
+                      models.Tag.tagged(tag))
+
+
+@api.route("/entries/<entry_id>")
+def entry(entry_id):
+    """Shows an entry, if the user may read it."""
+    fields = requested_fields(ENTRY_FIELDS, list(ENTRY_FIELDS))
+    try:
+        entry_id = models.parse_id(entry_id)
+    except ValueError:
+        raise APIError("Entry does not exist.", 404)
+    row = (entry_query(fields)
+           .where(models.Entry.id == entry_id)
+           .where(models.Entry.visible_to(current_user))
+           .tuples()
+           .first())
+    if row is None:
+        raise APIError("Entry does not exist.", 404)
+    if not row[-1]:
+        raise APIError("Entry is private.", 403)
+    return jsonify(data=serialize(fields, row))
+
+
+@api.route("/users")
+def users():
+    """Lists the users, in order of id."""
+    fields = requested_fields(USER_FIELDS, list(USER_FIELDS))
+    return id_page(models.User, fields, models.User.select(
+        *(USER_FIELDS[field] for field in fields), models.User.id))
+
+
+@api.route("/tags")
+def tags():
+    """Lists the tags of entries visible to the user, in order of id."""
+    fields = requested_fields(TAG_FIELDS, list(TAG_FIELDS))
+    return id_page(models.Tag, fields, models.Tag.select(
+        *(TAG_FIELDS[field] for field in fields), models.Tag.id).where(
+        models.fn.EXISTS(models.EntryTag
+                         .select(models.EntryTag.id)
+                         .join(models.Entry)
+                         .where((models.EntryTag.tag == models.Tag.id) &
+                                models.Entry.visible_to(current_user)))))
+
+
+# Supporting functions.
+def requested_fields(allowed: dict, default: list) -> list:
+    """Returns the fields named in the "fields" argument (or the default
+    fields).
+    """
+    if "fields" not in request.args:
+        return default
+    fields = [field.strip() for field in request.args["fields"].split(",")
+              if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise APIError(f"Unknown fields: {', '.join(unknown) or '(none)'}. "
+                       f"Available fields: {', '.join(allowed)}.")
+    return list(dict.fromkeys(fields))
+
+
+def page_size() -> int:
+    """Returns the page size given by the "limit" argument."""
+    try:
+        limit = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise APIError("The limit must be a number.")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def entry_query(fields: list):
+    """Returns a query selecting the fields of entries, followed by their date
+    and id (for cursors) and whether the user may read them.
+
+    The content fields are null for entries the user may not read.
+    """
+    readable = models.Entry.readable_by(current_user)
+    columns = [models.Case(None, [(readable, ENTRY_FIELDS[field])], None)
+               if field in CONTENT_FIELDS else ENTRY_FIELDS[field]
+               for field in fields]
+    return (models.Entry
+            .select(*columns, models.Entry.date, models.Entry.id,
+                    models.Case(None, [(readable, True)], False))
+            .join(models.User))
+
+
+def entry_page(where):
+    """Returns a page of the entries matching the predicate, in listing order.
+    """
+    fields = requested_fields(ENTRY_FIELDS, DEFAULT_ENTRY_FIELDS)
+    limit = page_size()
+    query = (entry_query(fields)
+             .where(where)
+             .order_by(models.Entry.date.asc(), models.Entry.id.asc()))
+    if request.args.get("after"):
+        try:
+            query = query.where(models.Entry.after(request.args["after"]))
+        except ValueError:
+            raise APIError("Malformed cursor.")
+    rows = list(query.limit(limit + 1).tuples())
+    after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        date, entry_id = rows[-1][-3:-1]
+        after = models.Entry.cursor(models.Entry.date.python_value(date),
+                                    entry_id)
+    return jsonify(data=[serialize(fields, row) for row in rows], next=after)
+
+
+def id_page(model, fields: list, query):
+    """Returns a page of a query whose last column is the id, in id order."""
+    limit = page_size()
+    query = query.order_by(model.id.asc())
+    if request.args.get("after"):
+        try:
+            query = query.where(
+                model.id > models.parse_id(request.args["after"]))
+        except ValueError:
+            raise APIError("Malformed cursor.")
+    rows = list(query.limit(limit + 1).tuples())
+    after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        after = str(rows[-1][-1])
+    return jsonify(data=[serialize(fields, row) for row in rows], next=after)
+
+
+def serialize(fields: list, row: tuple) -> dict:
+    """Returns the named fields at the start of a row as a JSON-ready dict."""
+    return {field: to_json(value) for field, value in zip(fields, row)}
+
+
+def to_json(value):
+    """Turns dates and times into text."""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
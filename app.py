@@ -6,48 +6,138 @@ from flask import (
     Flask,
     g,
     get_flashed_messages,
+    jsonify,
+    make_response,
     redirect,
     render_template,
     request,
+    Response,
+    session,
+    stream_with_context,
     url_for)
-from flask_bcrypt import (
-    check_password_hash,
-    generate_password_hash)
+from flask.sessions import SecureCookieSessionInterface
 from flask_login import (
     current_user,
     LoginManager,
     login_required,
     login_user,
     logout_user)
-import random
+import calendar
+import collections
+import datetime
+import hashlib
+import itertools
+import math
+from markupsafe import escape, Markup
+import os
+import secrets
 
+import api
+import assets
+import cache
+import compression
+import export
 import forms
+import metrics
 import models
+import passwords
+import slow_queries
+import stats
+import writes
 
-# Constants.
-DEBUG = True
-PORT = 8000
-HOST = '127.0.0.1'
+# Constants.  Settings can be overridden with environment variables.
+DEBUG = os.environ.get("JOURNAL_DEBUG", "0") == "1"
+PORT = int(os.environ.get("JOURNAL_PORT", 8000))
+HOST = os.environ.get("JOURNAL_HOST", '127.0.0.1')
+SECRET_KEY_FILE = os.environ.get("JOURNAL_SECRET_KEY_FILE", "secret_key")
+PAGE_SIZE = 20
+SEARCH_LIMIT = 50
+# Related entries shown with an entry.
+RELATED_SHOWN = 5
+# Tags shown in the tag cloud, and suggested by tag autocompletion.
+TAG_CLOUD_SIZE = 100
+COMPLETION_LIMIT = 10
+LISTING_CACHE_SIZE = 256
+# Streamed pages are sent in chunks of about this many characters.
+STREAM_CHUNK_SIZE = 8192
+BUSY_MESSAGE = "The server is busy.  Please try again in a moment."
+# Run writes in a single writer thread (see writes.py), rather than in the
+# request threads.
+WRITE_QUEUE = os.environ.get("JOURNAL_WRITE_QUEUE", "0") == "1"
 
 # Global variables.
-last_route = None
-cur_user = None
-cur_entry = None
-cur_tag = None
-"""Global variables are reset by each route, and track both the route and the
-    variable elements of the URL for the route.  These are used by the url_for
-    method in the get_last_route function to build a URL to which the user is
-    redirected after registering or logging in.  
+FLUSH = Markup("")
+"""Output by templates (streamed with stream_template) where everything
+    rendered so far should be sent.
+"""
+Validators = collections.namedtuple("Validators", ["etag", "last_modified"])
+"""Conditional request validators for a page."""
+
+listing_cache = cache.LRUCache(LISTING_CACHE_SIZE)
+"""Rendered entry listings, keyed by page, viewer and data version."""
+data_version = models.data_version
+"""Bumped after every write to entries or tags (see models.data_version)."""
+tag_index = cache.PrefixIndex(models.Tag.make_key)
+"""Tag names, and the number of (non-hidden) entries with each, for the tag
+    cloud and autocompletion.  Kept up to date by bump_data_version, and
+    reloaded when another process changes the data.
+"""
+write_queue = writes.WriteQueue(models.DATABASE) if WRITE_QUEUE else None
+"""Runs the writes in a single writer thread, if WRITE_QUEUE is set (see
+    write).
 """
 
 
 def get_secret_key():
-    """Generates a secret key for the flask app."""
-    return generate_password_hash(str(random.randint(100000, 999999)))
+    """Returns the secret key for the flask app.
+
+        Taken from the JOURNAL_SECRET_KEY environment variable if it is set, and
+        otherwise from the secret key file, which is generated the first time
+        it is needed.  Every worker process must use the same key, or sessions
+        signed by one are rejected by the others.
+    """
+    key = os.environ.get("JOURNAL_SECRET_KEY")
+    if key:
+        return key
+    if not os.path.exists(SECRET_KEY_FILE):
+        # Write the key to a temporary file first, then link it into place, so
+        # that a process starting at the same time never reads a partial key
+        # (or replaces a key another process is already using).
+        temp_file = f"{SECRET_KEY_FILE}.{os.getpid()}"
+        with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                          0o600), "w") as file:
+            file.write(secrets.token_hex(32))
+        try:
+            os.link(temp_file, SECRET_KEY_FILE)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_file)
+    with open(SECRET_KEY_FILE) as file:
+        return file.read().strip()
+
 
+class SessionInterface(SecureCookieSessionInterface):
+    """Leaves the session alone in static file responses.
 
+        Otherwise Flask-Login's reading of the session makes the responses
+        vary by cookie, and browsers would fetch the files again whenever the
+        session changed.
+    """
+
+    def save_session(self, app_, session_, response):
+        if request.endpoint in ("static", "asset"):
+            return
+        super().save_session(app_, session_, response)
+
+
+# The routes are registered on this app as the module is imported, and
+# create_app prepares it for serving.
 app = Flask(__name__, template_folder="templates")
-app.secret_key = get_secret_key()
+app.session_interface = SessionInterface()
+app.register_blueprint(api.api)
+app.add_template_global(assets.url, "asset_url")
+app.add_template_global(calendar.month_abbr, "month_abbr")
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -57,25 +147,43 @@ login_manager.login_view = "login"
 @login_manager.user_loader
 def load_user(userid):
     try:
-        return models.User.get(models.User.id == userid)
-    except models.DoesNotExist:
+        return models.User.get_cached(userid)
+    except (models.DoesNotExist, ValueError):
         return None
 
 
 # Housekeeping.
 @app.before_request
 def before_request():
-    """Connect to the database before each request."""
-    g.db = models.DATABASE
-    g.db.connect()
+    """Start measuring the request, and take a database connection from the
+    pool.
+
+    Static files don't need one.
+    """
+    metrics.start_request()
     g.user = current_user
+    if request.endpoint in ("static", "asset"):
+        return
+    g.db = models.DATABASE
+    g.db.connect(reuse_if_open=True)
 
 
 @app.after_request
 def after_request(response):
-    """Close the database connection after each request."""
-    g.db.close()
-    return response
+    """Compress the response if the client accepts it, and record the request's
+    metrics (by endpoint).
+    """
+    response = compression.gzip_response(response)
+    return metrics.finish_request(request.endpoint or "not_found", response)
+
+
+@app.teardown_request
+def teardown_request(_):
+    """Return the database connection to the pool after each request (even if
+    the request failed).
+    """
+    if not models.DATABASE.is_closed():
+        models.DATABASE.close()
 
 
 # View routes for the app.
@@ -87,40 +195,27 @@ def index(home=True):
     entries.  If a user is logged in, also displays links for the user's private
     and hidden entries.
     """
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "index"
-    cur_user = None
-    cur_entry = None
-    cur_tag = None
+    set_last_route("index")
     if current_user.is_authenticated:
-        if current_user.god:
-            entries = models.Entry.select().order_by(models.Entry.date.asc())
-        else:
-            entries = (models.Entry.select().where(
-                ((models.Entry.hidden == False) &  # noqa (must use == )
-                 (models.Entry.user != current_user.id)
-                 ) |
-                (models.Entry.user == current_user.id))
-                       .order_by(models.Entry.date.asc()))
-        return render_template(
-            "listing.html", entries=entries, user=current_user.username,
-            god=current_user.god, home=home, by="All")
+        user_ = current_user.username
+        god = current_user.god
     else:
-        entries = models.Entry.select().where(
-            models.Entry.hidden == False).order_by(
-            models.Entry.date.asc())  # noqa E712 (must use == for peewee)
-        return render_template("listing.html", entries=entries, user="",
-                               god=False, home=home, by="All")
+        user_ = ""
+        god = False
+    entries = models.Entry.listing().where(
+        models.Entry.visible_to(current_user))
+    validators = listing_validators(user_)
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    listings = render_listings(entries, user_, god, "All")
+    return validate(stream_template(
+        "listing.html", listings=listings, home=home, by="All"), validators)
 
 
 @app.route("/entries")
 def entries():
     """Prevents url_for from constructing "/entries" for "index"."""
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "entries"
-    cur_user = None
-    cur_entry = None
-    cur_tag = None
+    set_last_route("entries")
     return redirect(url_for("index"))
 
 
@@ -132,28 +227,11 @@ def user_entries(user):
         and links for all entries.  Otherwise, displays title and date for all
         non-hidden entries, and links for all public entries.
     """
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "user_entries"
-    cur_user = user
-    cur_entry = None
-    cur_tag = None
-    # Users not logged in can see non-hidden entries.
-    if not current_user.is_authenticated or (current_user.username != user
-                                             and current_user.god == False):  # noqa
-        entries = (models.Entry.select().where(
-            models.Entry.hidden == False)  # noqa E712 (must use == in peewee)
-                   .join(models.User)
-                   .where(models.User.username == user)
-                   .order_by(models.Entry.date.asc()))
-    # Logged-in users (and god) can see all their own entries, and non-hidden
-    # entries by others.
-    else:
-        try:
-            target_user = models.User.get(models.User.username == user)
-        except models.DoesNotExist:
-            flash("User does not exist.", "error")
-            return redirect(url_for("index"))
-        entries = target_user.entries.order_by(models.Entry.date.asc())
+    set_last_route("user_entries", user=user)
+    entries = user_listing(user)
+    if entries is None:
+        flash("User does not exist.", "error")
+        return redirect(url_for("index"))
     if current_user.is_authenticated:
         user_ = current_user.username
         if current_user.god:
@@ -168,8 +246,107 @@ def user_entries(user):
         god = False
         by = user
         user_ = ""
-    return render_template("listing.html", entries=entries, user=user_, god=god,
-                           home=False, by=by)
+    validators = listing_validators(user_)
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    listings = render_listings(entries, user_, god, by)
+    return validate(stream_template(
+        "listing.html", listings=listings, home=False, by=by,
+        export_user=user, archive=archive_counts(user),
+        archive_user=user), validators)
+
+
+@app.route("/entries/<user>/<int:year>", defaults={"month": None})
+@app.route("/entries/<user>/<int:year>/<int:month>")
+def user_archive(user, year, month):
+    """Displays a user's entries from one year or month.
+
+        The same entries are shown as on the user's page (see user_listing),
+        selected by a range of dates.
+    """
+    set_last_route("user_archive", user=user, year=year, month=month)
+    dates = period_dates(year, month)
+    if dates is None:
+        flash("There is no such month.", "error")
+        return redirect(url_for("user_entries", user=user))
+    entries = user_listing(user)
+    if entries is None:
+        flash("User does not exist.", "error")
+        return redirect(url_for("index"))
+    entries = entries.where(models.Entry.date.between(*dates))
+    if current_user.is_authenticated:
+        user_ = current_user.username
+        god = current_user.god
+        by = "You" if current_user.username == user else user
+    else:
+        user_ = ""
+        god = False
+        by = user
+    validators = listing_validators(user_)
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    listings = render_listings(entries, user_, god, by)
+    return validate(stream_template(
+        "listing.html", listings=listings, home=False, by=by,
+        period=period_name(year, month), archive=archive_counts(user),
+        archive_user=user), validators)
+
+
+@app.route("/archive")
+@app.route("/archive/<int:year>", defaults={"month": None})
+@app.route("/archive/<int:year>/<int:month>")
+def archive(year=None, month=None):
+    """Displays everyone's entries from one year or month (or, without a year,
+        just the number of entries in each).
+
+        Shows the same entries as the home page, selected by a range of dates.
+    """
+    set_last_route("archive", year=year, month=month)
+    if current_user.is_authenticated:
+        user_ = current_user.username
+        god = current_user.god
+    else:
+        user_ = ""
+        god = False
+    if year is None:
+        return render_template("listing.html", listings=[], home=False,
+                               by="All", archive=archive_counts())
+    dates = period_dates(year, month)
+    if dates is None:
+        flash("There is no such month.", "error")
+        return redirect(url_for("archive"))
+    entries = (models.Entry.listing()
+               .where(models.Entry.visible_to(current_user) &
+                      models.Entry.date.between(*dates)))
+    validators = listing_validators(user_)
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    listings = render_listings(entries, user_, god, "All")
+    return validate(stream_template(
+        "listing.html", listings=listings, home=False, by="All",
+        period=period_name(year, month), archive=archive_counts()),
+        validators)
+
+
+@app.route("/entries/<user>/export")
+def export_entries(user):
+    """Downloads a user's entries, in the format given by the "format" argument
+        (jsonl, csv or markdown).
+
+        Only the entries the current user may read are exported:  all of the
+        user's entries for the user (and for god), and otherwise their entries
+        which are neither private nor hidden.
+    """
+    return export_response(user)
+
+
+@app.route("/export")
+def export_all():
+    """Downloads every user's entries (for god only)."""
+    if not (current_user.is_authenticated and current_user.god):
+        flash("Cannot export entries.", "error")
+        return redirect(url_for("index"))
+    return export_response(None)
 
 
 @app.route("/register", methods=("GET", "POST"))
@@ -181,10 +358,15 @@ def register():
         try:
             models.User.get(models.User.username == form.username.data)
         except models.DoesNotExist:
-            models.User.create_user(
-                username=form.username.data,
-                password=form.password.data,
-                god=False)
+            try:
+                # (Hashed here, so as not to hold up the writer thread.)
+                password_hash = passwords.hash_password(form.password.data)
+            except passwords.Busy:
+                flash(BUSY_MESSAGE, "error")
+                return render_template("form.html", button="Register",
+                                       form=form, cancel_url=get_last_route())
+            write(models.User.add_user, form.username.data, password_hash,
+                  False)
             flash("Registration successful", "success")
             # Automatically log in after registration.
             login_user(models.User.get(
@@ -207,8 +389,17 @@ def login():
         except models.DoesNotExist:
             flash("Incorrect username or password.", "error")
         else:
+            try:
+                correct = user.check_password(form.password.data)
+            except passwords.Busy:
+                flash(BUSY_MESSAGE, "error")
+                return render_template("form.html", button="Log In",
+                                       form=form, cancel_url=get_last_route())
             # If the login is successful, redirect back to the previous page.
-            if check_password_hash(user.password, form.password.data):
+            if correct:
+                # Passwords hashed at an old bcrypt cost are saved rehashed.
+                if user.rehash_password(form.password.data):
+                    write(user.save_password)
                 login_user(user)
                 flash("Login successful.", "success")
                 return redirect(get_last_route())
@@ -234,11 +425,7 @@ def logout():
 @app.route("/entries/new", methods=("GET", "POST"))
 def create_entry():
     """Creates a new entry."""
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "create_entry"
-    cur_user = None
-    cur_entry = None
-    cur_tag = None
+    set_last_route("create_entry")
     # Prompt to login, if the user isn't already.
     if not current_user.is_authenticated:
         return redirect(url_for("login"))
@@ -249,7 +436,7 @@ def create_entry():
         if form.hidden.data:
             form.private.data = True
         # Record creation.
-        entry = models.Entry.create(
+        tag_changes = write(add_entry, dict(
             user=user,
             title=form.title.data,
             date=form.date.data,
@@ -258,10 +445,8 @@ def create_entry():
             resources=form.resources.data,
             tags=form.tags.data,
             private=form.private.data,
-            hidden=form.hidden.data)
-        # Tags need to be added to the Tag and EntryTag tables.  Searches for
-        # tags may be case-insensitive, but actual tags will be stored as-is.
-        update_tags(entry, entry.tags, "")
+            hidden=form.hidden.data))
+        bump_data_version(tag_changes)
         flash("Entry saved.", "success")
         # Send the user back to their own page.
         return redirect(url_for("user_entries", user=user.username))
@@ -272,11 +457,7 @@ def create_entry():
 @app.route("/entries/<int:entry_id>", methods=("GET", "POST"))
 def show_entry(entry_id):
     """Displays a single entry, if the user is authorized to view it."""
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "show_entry"
-    cur_user = None
-    cur_entry = entry_id
-    cur_tag = None
+    set_last_route("show_entry", entry=entry_id)
     message = None
     category = None
     try:
@@ -307,17 +488,31 @@ def show_entry(entry_id):
         author = True
     else:
         author = False
-    return render_template("detail.html", entry=entry, tags=tags, author=author)
+    # Related entries, as they would appear in the user's listings.
+    related = list(models.Related.listing(entry)
+                   .where(models.Entry.visible_to(current_user))
+                   .limit(RELATED_SHOWN))
+    validators = Validators(
+        make_etag(current_user.get_id(), entry.id, entry.modified,
+                  [(listing.id, listing.modified) for listing in related]),
+        max([entry.modified] + [listing.modified for listing in related]))
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    if current_user.is_authenticated:
+        user_ = current_user.username
+        god = current_user.god
+    else:
+        god = False
+        user_ = ""
+    return validate(make_response(render_template(
+        "detail.html", entry=entry, tags=tags, author=author, related=related,
+        user=user_, god=god)), validators)
 
 
 @app.route("/entries/<int:entry_id>/edit", methods=("GET", "POST"))
 def edit_entry(entry_id):
     """Allows the user to edit an entry, if they are authorized to do so."""
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "edit_entry"
-    cur_user = None
-    cur_entry = entry_id
-    cur_tag = None
+    set_last_route("edit_entry", entry=entry_id)
     # Prompt to login if the user isn't already.
     if not current_user.is_authenticated:
         return redirect(url_for("login"))
@@ -334,11 +529,8 @@ def edit_entry(entry_id):
         flash("Cannot edit entry.", "error")
         return redirect(url_for("show_entry", entry_id=entry_id))
     form = forms.EntryForm()
-    old_tags = ""
     # Only pre-populate the fields before initial display.
     if request.method == "GET":
-        # Get the current tag list to compare to any changes the user makes.
-        old_tags = entry.tags
         form.title.data = entry.title
         form.date.data = entry.date
         form.time_spent.data = entry.time_spent
@@ -349,6 +541,7 @@ def edit_entry(entry_id):
         form.hidden.data = entry.hidden
     # Process the submitted form.
     if form.validate_on_submit():
+        was_hidden = entry.hidden
         entry.title = form.title.data
         entry.date = form.date.data
         entry.time_spent = form.time_spent.data
@@ -362,9 +555,8 @@ def edit_entry(entry_id):
         # (Yes, I could use two radio buttons to implement this.  I'm not.)
         if form.hidden.data:
             entry.private = True
-        entry.save()
-        # Update tags (add new tags, delete deleted tags).
-        update_tags(entry, entry.tags, old_tags)
+        tag_changes = write(save_entry, entry, was_hidden)
+        bump_data_version(tag_changes)
         flash("Entry edited.", "success")
         return redirect(url_for("show_entry", entry_id=entry_id))
     return render_template(
@@ -374,11 +566,7 @@ def edit_entry(entry_id):
 @app.route("/entries/<int:entry_id>/delete", methods=("GET", "POST"))
 def delete_entry(entry_id):
     """Deletes an entry, if the user is authorized to do so."""
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "delete_entry"
-    cur_user = None
-    cur_entry = entry_id
-    cur_tag = None
+    set_last_route("delete_entry", entry=entry_id)
     # Prompt to log in if the user isn't already.
     if not current_user.is_authenticated:
         return redirect(url_for("login"))
@@ -393,9 +581,8 @@ def delete_entry(entry_id):
         flash("Cannot delete entry.", "error")
         return redirect(url_for("show_entry", entry_id=entry_id))
     target_user = entry.user.username
-    # Delete associated tags before deleting the entry.
-    update_tags(entry, "", entry.tags)
-    entry.delete_instance()
+    tag_changes = write(remove_entry, entry)
+    bump_data_version(tag_changes)
     flash("Entry deleted.", "success")
     return redirect(url_for("user_entries", user=target_user))
 
@@ -406,39 +593,7 @@ def show_tag(tag):
 
         Shows hidden entries only to the author (or to god).
     """
-    global last_route, cur_user, cur_entry, cur_tag
-    last_route = "show_tag"
-    cur_user = None
-    cur_entry = None
-    cur_tag = tag
-    # Make sure some variation of the tag exists. Doesn't matter which one is
-    # used as the search pattern.
-    try:
-        search_tag = models.Tag.select().where(models.Tag.name ** tag).get()
-    except models.DoesNotExist:
-        flash(f"Tag {tag} not found.", "error")
-        return redirect(get_last_route())
-    all_entries = search_tag.entries()
-    # Users who are not logged in do not see any hidden entries.
-    if not current_user.is_authenticated:
-        entries = []
-        for entry in all_entries:
-            if not entry.hidden:
-                entries.append(entry)
-    # Non-god users see only their own hidden entries.
-    elif not current_user.god:
-        entries = []
-        for entry in all_entries:
-            if not (entry.hidden and entry.user.id != current_user.id):
-                entries.append(entry)
-    else:
-        entries = list(all_entries)
-    # If all matching records got filtered out, do not reveal that there were
-    # matching hidden records.
-    if len(entries) == 0:
-        flash(f"Tag {tag} not found.", "error")
-        # Note request.referrer actually works for non-form views.
-        return redirect(request.referrer)
+    set_last_route("show_tag", tag=tag)
     if current_user.is_authenticated:
         user_ = current_user.username
         if current_user.god:
@@ -448,67 +603,523 @@ def show_tag(tag):
     else:
         god = False
         user_ = ""
-    # For some reason this list is always in descending order.  Reverse it to be
-    # consistent with other listings.
-    entries.reverse()
-    return render_template("tag_listing.html", entries=entries, user=user_,
-                           god=god, home=False, by="All", tag=tag)
+    # Any variation of the tag matches.  Users who are not logged in do not
+    # see any hidden entries; non-god users see only their own hidden entries.
+    entries = models.Tag.listing(tag).where(
+        models.Entry.visible_to(current_user))
+    # If the tag doesn't exist, or all matching records got filtered out, do not
+    # reveal that there were matching hidden records.
+    if not entries.exists():
+        flash(f"Tag {tag} not found.", "error")
+        # Note request.referrer actually works for non-form views.
+        return redirect(request.referrer or url_for("index"))
+    validators = listing_validators(user_)
+    if not_modified(validators):
+        return validate(make_response("", 304), validators)
+    listings = render_listings(entries, user_, god, "All")
+    return validate(stream_template(
+        "tag_listing.html", listings=listings, home=False, tag=tag),
+        validators)
+
+
+@app.route("/tags")
+def tag_cloud():
+    """Shows the most used tags, sized by the number of entries with each.
+
+        Served from the tag index, which counts only non-hidden entries (for
+        everyone, so that it can be shared).
+    """
+    set_last_route("tag_cloud")
+    tags = current_tag_index().top(TAG_CLOUD_SIZE)
+    most = max((count for _, count in tags), default=1)
+    # Five sizes, by the logarithm of the count.
+    cloud = sorted(
+        (name, count, 1 + round(4 * math.log(count) / math.log(most))
+         if most > 1 else 1)
+        for name, count in tags)
+    return render_template("tags.html", cloud=cloud, home=False)
+
+
+@app.route("/autocomplete/tags")
+def complete_tags():
+    """Suggests tags starting with the "q" argument, most used first, as JSON.
+
+        Served from the tag index, without querying the database.
+    """
+    prefix = request.args.get("q", "").strip()
+    try:
+        limit = min(int(request.args.get("limit", COMPLETION_LIMIT)),
+                    COMPLETION_LIMIT)
+    except ValueError:
+        limit = COMPLETION_LIMIT
+    suggestions = current_tag_index().complete(prefix, limit) if prefix else []
+    return jsonify(data=[{"name": name, "count": count}
+                         for name, count in suggestions])
+
+
+@app.route("/search")
+def search():
+    """Shows the entries whose title, text or resources match the search words.
+
+        Only entries the user may read are searched, so that matches can't
+        reveal the contents of private or hidden entries.
+    """
+    set_last_route("search")
+    query = request.args.get("q", "").strip()
+    entries = []
+    # (A query of nothing but control characters has no words to search for.)
+    if models.EntryIndex.quote(query):
+        entries = list(models.EntryIndex.search(query)
+                       .where(models.Entry.visible_to(current_user) &
+                              models.Entry.readable_by(current_user))
+                       .limit(SEARCH_LIMIT))
+        for entry in entries:
+            entry.snippet = highlight(entry.snippet)
+    if current_user.is_authenticated:
+        user_ = current_user.username
+        god = current_user.god
+    else:
+        god = False
+        user_ = ""
+    return render_template("search.html", entries=entries, user=user_,
+                           god=god, home=False, by="All", query=query)
+
+
+@app.route("/stats")
+def show_stats():
+    """Shows the number of entries and the time spent on them, by month,
+        author and tag.
+
+        Read from the rollup tables (see stats.py).  Hidden entries are only
+        counted for god, since the totals can't tell whose they are.
+    """
+    set_last_route("show_stats")
+    god = current_user.is_authenticated and current_user.god
+    return render_template("stats.html", stats=stats.summary(hidden=god),
+                           duration=stats.duration, home=False)
+
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    """Serves a built static file (see assets.py)."""
+    return assets.send(filename)
+
+
+@app.route("/metrics")
+def show_metrics():
+    """Request metrics of this worker process, in the Prometheus text
+        format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 # Supporting functions.
+def set_last_route(route: str, user: str = None, entry: int = None,
+                   tag: str = None, year: int = None,
+                   month: int = None) -> None:
+    """Records the route, and the variable elements of its URL, in the session.
+
+        Each view route records itself, so that get_last_route can send the
+        user back to it after registering or logging in.
+    """
+    last_route = {"route": route, "user": user, "entry": entry, "tag": tag}
+    # (Only archives have a period, and older sessions don't record one.)
+    if year:
+        last_route.update(year=year, month=month)
+    # Only touch the session cookie when the route changes.
+    if session.get("last_route") != last_route:
+        session["last_route"] = last_route
+
+
 def get_last_route():
     """Returns data for the url_for method based on the last route processed.
 
         Used to redirect the user to the previous page.
     """
+    last_route = session.get("last_route")
     if last_route is None:
         return url_for("index")
-    elif last_route in ["user_entries"]:
-        return url_for(last_route, user=cur_user)
-    elif last_route in ["show_entry", "edit_entry", "delete_entry"]:
-        return url_for(last_route, entry_id=cur_entry)
-    elif last_route in ["show_tag"]:
-        return url_for(last_route, tag=cur_tag)
+    route = last_route["route"]
+    if route in ["user_entries"]:
+        return url_for(route, user=last_route["user"])
+    elif route in ["show_entry", "edit_entry", "delete_entry"]:
+        return url_for(route, entry_id=last_route["entry"])
+    elif route in ["show_tag"]:
+        return url_for(route, tag=last_route["tag"])
+    elif route in ["user_archive"]:
+        return url_for(route, user=last_route["user"],
+                       year=last_route["year"], month=last_route["month"])
+    elif route in ["archive"] and last_route.get("year"):
+        return url_for(route, year=last_route["year"],
+                       month=last_route["month"])
     else:
-        return url_for(last_route)
-
-
-def update_tags(entry, new_tags: str, old_tags: str) -> None:
-    """Updates tag references as needed."""
-    # Turn the tag strings into lists (without empty members).
-    new_tags = listify(new_tags)
-    old_tags = listify(old_tags)
-    # Delete removed tags:
-    for tag in old_tags:
-        if tag not in new_tags:
-            # First, delete the instance of the entry/tag combo.
-            search_tag = models.Tag.get(models.Tag.name == tag)
-            entry_tag = models.EntryTag.get(
-                models.EntryTag.entry == entry,
-                models.EntryTag.tag == search_tag)
-            entry_tag.delete_instance()
-            # If no more instances of the tag exist, delete the tag itself.
-            search = (models.EntryTag.select()
-                      .where(models.EntryTag.tag == search_tag))
-            if len(search) == 0:
-                search_tag.delete_instance()
-    # Add new tags:
-    for tag in new_tags:
-        if tag not in old_tags:
-            # First, see if the tag already exists; create it if it doesn't.
-            try:
-                search_tag = models.Tag.create(name=tag)
-            except models.IntegrityError:
-                search_tag = models.Tag.get(models.Tag.name == tag)
-            # Check to see if the entry/tag combo already exists.
-            try:
-                models.EntryTag.get(
-                    models.EntryTag.entry == entry,
-                    models.EntryTag.tag == search_tag)
-            # If it does, do nothing.  If it doesn't, create it.
-            except models.DoesNotExist:
-                models.EntryTag.create(entry=entry, tag=search_tag)
-    return
+        return url_for(route)
+
+
+def user_listing(user: str):
+    """Returns a listing query for the user's entries which the current user
+        may see (None if a logged-in user asks for a user who doesn't exist).
+
+        Users not logged in see non-hidden entries.  Logged-in users (and god)
+        see all of their own entries, and non-hidden entries by others.
+    """
+    if not current_user.is_authenticated or (current_user.username != user
+                                             and current_user.god == False):  # noqa
+        return (models.Entry.listing()
+                .where(models.Entry.hidden == False)  # noqa E712
+                .where(models.User.username == user))
+    try:
+        target_user = models.User.get(models.User.username == user)
+    except models.DoesNotExist:
+        return None
+    return models.Entry.listing().where(models.Entry.user == target_user)
+
+
+def period_dates(year: int, month: int = None):
+    """Returns the first and last dates of a year or month (None if there is
+        no such month).
+    """
+    if not datetime.MINYEAR <= year <= datetime.MAXYEAR:
+        return None
+    if month is None:
+        return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    if not 1 <= month <= 12:
+        return None
+    return (datetime.date(year, month, 1),
+            datetime.date(year, month, calendar.monthrange(year, month)[1]))
+
+
+def period_name(year: int, month: int = None) -> str:
+    """Returns the name of a year or month, e.g. "October 2020"."""
+    if month is None:
+        return str(year)
+    return f"{calendar.month_name[month]} {year}"
+
+
+def archive_counts(user: str = None) -> list:
+    """Returns the number of entries the current user may see in each year and
+        month (of one user, or of everyone), latest first, as (year, count,
+        [(month, count), ...]).
+
+        Counted from the statistics rollups, in one grouped query.
+    """
+    month = models.UserMonth.month
+    query = (models.UserMonth
+             .select(month, models.fn.SUM(models.UserMonth.entries))
+             .where(models.UserMonth.visible_to(current_user))
+             .group_by(month)
+             .order_by(month.desc()))
+    if user:
+        query = query.join(models.User).where(models.User.username == user)
+    rows = [(int(period[:4]), int(period[5:]), count)
+            for period, count in query.tuples()]
+    years = []
+    for year, months in itertools.groupby(rows, key=lambda row: row[0]):
+        months = [(month, count) for _, month, count in months]
+        years.append((year, sum(count for _, count in months), months))
+    return years
+
+
+def paginate(query) -> tuple:
+    """Returns one page of a listing query, and the cursor for the next page.
+
+        Pages are selected by keyset (the "after" argument of the request holds
+        the date and id of the last entry on the previous page), so every page
+        is an index range scan no matter how deep it is.  The cursor is None on
+        the last page.
+    """
+    query = query.order_by(models.Entry.date.asc(), models.Entry.id.asc())
+    try:
+        query = query.where(models.Entry.after(request.args["after"]))
+    # A missing or malformed cursor just starts at the first page.
+    except (KeyError, ValueError):
+        pass
+    entries = list(query.limit(PAGE_SIZE + 1))
+    if len(entries) > PAGE_SIZE:
+        entries = entries[:PAGE_SIZE]
+        return entries, models.Entry.cursor(entries[-1].date, entries[-1].id)
+    return entries, None
+
+
+def export_response(username: str = None):
+    """Returns a response streaming the entries the current user may read (of
+        one user, or of every user) in the requested export format.
+    """
+    export_format = request.args.get("format", "jsonl")
+    if export_format not in export.FORMATS:
+        flash(f"Unknown export format: {export_format}", "error")
+        return redirect(get_last_route())
+    mimetype = export.FORMATS[export_format][1]
+    rows = export.entries(username, models.Entry.visible_to(current_user) &
+                          models.Entry.readable_by(current_user))
+
+    # stream_with_context keeps the request (and so its database connection)
+    # open until the last row has been sent.
+    return Response(
+        stream_with_context(export.stream(rows, export_format)),
+        mimetype=mimetype,
+        headers={"Content-Disposition":
+                 f'attachment; filename="'
+                 f'{export.filename(username or "journal", export_format)}"'})
+
+
+def render_listings(query, user_: str, god: bool, by: str):
+    """Yields the rendered entry listings (with page links) for the request's
+    page of a listing query, in pieces, as the page streams.
+
+        Rendered pages are cached by viewer and data version, so the query runs
+        only if the viewer hasn't seen the page since the last write.
+    """
+    key = (request.path, request.args.get("after"), user_,
+           data_version.value)
+    listings = listing_cache.get(key)
+    if listings is not None:
+        yield listings
+        return
+    # Send the page so far while the query runs.
+    yield FLUSH
+    entries, after = paginate(query)
+    context = dict(entries=entries, user=user_, god=god, by=by, after=after)
+    app.update_template_context(context)
+    pieces = []
+    for piece in app.jinja_env.get_template("listings.html").generate(
+            context):
+        pieces.append(piece)
+        yield piece
+    listing_cache.set(key, Markup("".join(pieces)))
+
+
+def stream_template(template_name: str, **context):
+    """Returns a response streaming the rendered template.
+
+        The page is sent in chunks of about STREAM_CHUNK_SIZE characters, and
+        whatever has been rendered is sent early wherever the template outputs
+        FLUSH.  Messages are flashed before the response starts, since the
+        session can't be changed once it has.
+    """
+    get_flashed_messages()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+
+    def generate():
+        chunk = []
+        size = 0
+        for piece in template.generate(context):
+            if piece == FLUSH or size >= STREAM_CHUNK_SIZE:
+                if chunk:
+                    yield "".join(chunk)
+                chunk = []
+                size = 0
+            chunk.append(piece)
+            size += len(piece)
+        if chunk:
+            yield "".join(chunk)
+
+    return Response(stream_with_context(generate()), mimetype="text/html")
+
+
+def listing_validators(user_: str) -> Validators:
+    """Returns the validators for a page of a listing.
+
+        The entity tag is computed from the data version, the viewer and the
+        page's full path (with any cursor), so no query is needed: every save
+        bumps the data version.  Listings have no Last-Modified time, since
+        deleting or hiding an entry changes a listing without changing the
+        time any of the entries left in it were saved.
+    """
+    return Validators(
+        make_etag(data_version.value, user_, request.full_path), None)
+
+
+def make_etag(*parts) -> str:
+    """Returns an entity tag identifying the given response parts."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def not_modified(validators: Validators) -> bool:
+    """Returns True if the client's cached copy of the page is still current.
+
+        Never true while messages are waiting to be flashed, since a cached
+        copy can't show them.
+    """
+    if "_flashes" in session:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(validators.etag)
+    if request.if_modified_since and validators.last_modified:
+        if_modified_since = request.if_modified_since
+        if if_modified_since.tzinfo is None:
+            if_modified_since = if_modified_since.replace(
+                tzinfo=datetime.timezone.utc)
+        return (if_modified_since >=
+                validators.last_modified.replace(
+                    microsecond=0, tzinfo=datetime.timezone.utc))
+    return False
+
+
+def validate(response, validators: Validators):
+    """Adds the validators to a response.
+
+        Pages differ by viewer, so only the browser may cache them, and it must
+        revalidate them each time.  Entity tags are weak, since a page may be
+        sent compressed or not.
+    """
+    response.set_etag(validators.etag, weak=True)
+    if validators.last_modified:
+        response.last_modified = validators.last_modified.replace(
+            tzinfo=datetime.timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def write(job, *args):
+    """Runs a write job (a function which writes to the database) with the
+        arguments in a transaction, and returns its result.
+
+        With the write queue on, the job runs in the writer thread, committed
+        together with any other jobs waiting there, and this waits for it.
+    """
+    if write_queue:
+        return write_queue.run(job, *args)
+    with models.DATABASE.atomic():
+        return job(*args)
+
+
+def add_entry(fields: dict) -> list:
+    """Write job which creates an entry, and returns the changes to the tag
+        index (see update_tags).
+    """
+    entry = models.Entry.create(**fields)
+    # Tags need to be added to the Tag and EntryTag tables.  Searches for tags
+    # may be case-insensitive, but actual tags will be stored as-is.
+    tag_changes = update_tags(entry, entry.tags)
+    models.EntryIndex.add(entry)
+    models.Rollup.add(entry)
+    return tag_changes
+
+
+def save_entry(entry, was_hidden: bool) -> list:
+    """Write job which saves an edited entry, and returns the changes to the
+        tag index.
+    """
+    # The statistics count the entry as it was until it's saved.
+    models.Rollup.remove(entry)
+    entry.save()
+    # Update tags (add new tags, delete deleted tags).
+    tag_changes = update_tags(entry, entry.tags, was_hidden)
+    models.EntryIndex.add(entry)
+    models.Rollup.add(entry)
+    return tag_changes
+
+
+def remove_entry(entry) -> list:
+    """Write job which deletes an entry, and returns the changes to the tag
+        index.
+    """
+    # Delete associated statistics and tags before deleting the entry.
+    models.Rollup.remove(entry)
+    tag_changes = update_tags(entry, "")
+    models.EntryIndex.remove(entry)
+    entry.delete_instance()
+    return tag_changes
+
+
+def update_tags(entry, new_tags: str, was_hidden: bool = None) -> list:
+    """Updates tag references to match the entry's tag string, and returns the
+        changes to the tag index, as (name, delta) pairs.
+
+        Works out the differences with set-based queries in one transaction, so
+        the number of queries does not depend on the number of tags.  Callers
+        must pass the changes to bump_data_version once the transaction
+        commits (not before, since it may yet be rolled back).  was_hidden is
+        whether the entry was hidden before it was changed (if not the same as
+        now), for the tag index.
+    """
+    if was_hidden is None:
+        was_hidden = entry.hidden
+    # Turn the tag string into a list (without empty or repeated members).
+    new_tags = list(dict.fromkeys(listify(new_tags)))
+    with models.DATABASE.atomic():
+        old_tags = dict(models.Tag.select(models.Tag.name, models.Tag.id)
+                        .join(models.EntryTag)
+                        .where(models.EntryTag.entry == entry)
+                        .tuples())
+        # Delete removed tags:
+        removed_tags = [tag_id for name, tag_id in old_tags.items()
+                        if name not in new_tags]
+        changed = removed_tags or len(new_tags) != len(old_tags)
+        if removed_tags:
+            # First, delete the instances of the entry/tag combos.
+            (models.EntryTag.delete()
+             .where((models.EntryTag.entry == entry) &
+                    (models.EntryTag.tag.in_(removed_tags)))
+             .execute())
+            # If no more instances of a tag exist, delete the tag itself.
+            (models.Tag.delete()
+             .where(models.Tag.id.in_(removed_tags) &
+                    ~models.fn.EXISTS(models.EntryTag.select()
+                               .where(models.EntryTag.tag == models.Tag.id)))
+             .execute())
+        # Add new tags:
+        if new_tags:
+            # Create the tags which don't already exist.
+            (models.Tag.insert_many(
+                [{"name": tag, "key": models.Tag.make_key(tag)}
+                 for tag in new_tags])
+             .on_conflict_ignore()
+             .execute())
+            # Create the entry/tag combos which don't already exist.
+            (models.EntryTag.insert_from(
+                models.Tag.select(models.Value(entry.id), models.Tag.id)
+                .where(models.Tag.name.in_(new_tags)),
+                fields=[models.EntryTag.entry, models.EntryTag.tag])
+             .on_conflict_ignore()
+             .execute())
+        if changed:
+            models.Related.refresh(entry)
+    # The tag index counts the tags of non-hidden entries.
+    tag_changes = []
+    if not was_hidden:
+        tag_changes.extend((name, -1) for name in old_tags)
+    if not entry.hidden:
+        tag_changes.extend((name, 1) for name in new_tags)
+    return tag_changes
+
+
+def bump_data_version(tag_changes: list = ()) -> None:
+    """Bumps the data version after a write's transaction commits.
+
+        The write's changes to the tag index (from update_tags) are applied to
+        this process's index here, so the index stays current unless another
+        process wrote since it was loaded.
+    """
+    for name, delta in tag_changes:
+        tag_index.change(name, delta)
+    tag_index.advance(*data_version.bump())
+
+
+def current_tag_index() -> cache.PrefixIndex:
+    """Returns the tag index, reloading it first if the data has changed
+        since it was loaded (or it hasn't been).
+    """
+    version = data_version.value
+    if not tag_index.loaded or tag_index.version != version:
+        # (Counted from the statistics rollups, which are much smaller than
+        # the tag links.)
+        totals = (models.TagMonth.totals(models.Tag.name, hidden=False)
+                  .join(models.Tag)
+                  .tuples())
+        tag_index.load(((name, entries) for name, entries, _ in totals),
+                       version)
+    return tag_index
+
+
+def highlight(snippet: str) -> Markup:
+    """Escapes a search result snippet, and marks up its matched words."""
+    return (escape(snippet)
+            .replace(models.SNIPPET_START, Markup("<mark>"))
+            .replace(models.SNIPPET_END, Markup("</mark>")))
 
 
 def listify(string: str) -> list:
@@ -522,8 +1133,36 @@ def listify(string: str) -> list:
     return final_list
 
 
+def create_app(config: dict = None) -> Flask:
+    """Prepares the app (and its database) for serving, and returns it.
+
+        There is one app per process, which the routes are registered on when
+        this module is imported; this sets it up, so that importing the module
+        has no other effects.  The secret key is read (or generated) and the
+        database's statements are instrumented the first time only; later
+        calls just apply the config.
+
+        Settings come from the module constants, and can be overridden with
+        the config dict.  See wsgi.py for serving it with several worker
+        processes and threads.
+    """
+    if app.secret_key is None:
+        app.secret_key = get_secret_key()
+        metrics.instrument(app, models.DATABASE)
+        slow_queries.install(models.DATABASE)
+    app.config["DEBUG"] = DEBUG
+    if config:
+        app.config.update(config)
+    models.initialize()
+    assets.load()
+    with models.DATABASE.connection_context():
+        current_tag_index()
+    # Don't hand any pooled connections down to forked worker processes.
+    models.DATABASE.close_all()
+    return app
+
+
 # EXECUTION BEGINS HERE
 if __name__ == "__main__":
-    models.initialize()
-    app.run(debug=DEBUG, host=HOST, port=PORT)
+    create_app().run(host=HOST, port=PORT)
 # EXECUTION ENDS HERE
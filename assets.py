@@ -0,0 +1,140 @@
+"""Static asset module for the Learning Journal app.
+
+build() copies each asset under static/ into static/build/, with a hash of its
+contents in its name (css/site.css becomes e.g. css/site.1a2b3c4d5e.css), next
+to gzip (and, if the brotli package is installed, brotli) compressed copies,
+and writes a manifest of the new names.  Templates link to the copies with
+asset_url(), and the app serves them from /assets/ with headers which let
+browsers keep them for a year without checking back, since a changed file gets
+a new name.  Build the assets after changing them with:
+
+    python assets.py
+
+(The app also builds them when it starts, if any have changed.)
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available.
+    brotli = None
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "static")
+BUILD_FOLDER = os.path.join(STATIC_FOLDER, "build")
+MANIFEST_FILE = os.path.join(BUILD_FOLDER, "manifest.json")
+# File types which are assets, and those of them worth compressing.
+EXTENSIONS = {".css", ".js", ".svg", ".ico", ".png", ".jpg", ".gif", ".woff2"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".ico"}
+# Content encodings of the compressed copies, best first:  (encoding, file
+# suffix, compression function).
+ENCODINGS = [("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+if brotli:
+    ENCODINGS.insert(0, ("br", ".br", brotli.compress))
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+manifest = {}
+"""Built asset names, by source name (relative to static/)."""
+
+
+def sources():
+    """Yields the paths of the assets under static/ (not built copies)."""
+    for directory, subdirectories, files in os.walk(STATIC_FOLDER):
+        if directory == STATIC_FOLDER and "build" in subdirectories:
+            subdirectories.remove("build")
+        for name in files:
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                yield os.path.join(directory, name)
+
+
+def build() -> dict:
+    """Builds every asset, and returns the manifest."""
+    built = {}
+    for source in sources():
+        stem, extension = os.path.splitext(
+            os.path.relpath(source, STATIC_FOLDER).replace(os.sep, "/"))
+        with open(source, "rb") as file:
+            data = file.read()
+        built_name = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}" \
+                     f"{extension}"
+        write(built_name, data)
+        if extension.lower() in COMPRESSIBLE:
+            for _, suffix, compress in ENCODINGS:
+                compressed = compress(data)
+                if len(compressed) < len(data):
+                    write(built_name + suffix, compressed)
+        built[stem + extension] = built_name
+    # Older copies are kept, for pages which still link to them.
+    write("manifest.json",
+          json.dumps(built, indent=2, sort_keys=True).encode())
+    return built
+
+
+def write(name: str, data: bytes) -> None:
+    """Writes a file into the build folder (whole, or not at all)."""
+    path = os.path.join(BUILD_FOLDER, *name.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = f"{path}.{os.getpid()}"
+    with open(temp_file, "wb") as file:
+        file.write(data)
+    os.replace(temp_file, path)
+
+
+def load() -> None:
+    """Loads the manifest, building the assets first if there isn't one or
+    any asset has changed since it was written.
+    """
+    try:
+        built_time = os.stat(MANIFEST_FILE).st_mtime
+    except FileNotFoundError:
+        built_time = None
+    if built_time is None or any(os.stat(source).st_mtime > built_time
+                                 for source in sources()):
+        built = build()
+    else:
+        with open(MANIFEST_FILE) as file:
+            built = json.load(file)
+    manifest.clear()
+    manifest.update(built)
+
+
+def url(filename: str) -> str:
+    """Returns the URL of the built copy of a static file (or of the file
+    itself, if it hasn't been built).
+    """
+    if filename in manifest:
+        return url_for("asset", filename=manifest[filename])
+    return url_for("static", filename=filename)
+
+
+def send(filename: str):
+    """Returns a response serving a built asset, compressed if the client
+    accepts one of its compressed copies.
+    """
+    suffix = ""
+    encoding = None
+    for name, name_suffix, _ in ENCODINGS:
+        if (name in request.accept_encodings and os.path.exists(
+                os.path.join(BUILD_FOLDER, filename + name_suffix))):
+            encoding, suffix = name, name_suffix
+            break
+    response = send_from_directory(
+        BUILD_FOLDER, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0])
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+if __name__ == "__main__":
+    for source, built_name in sorted(build().items()):
+        print(f"{source} -> {built_name}")
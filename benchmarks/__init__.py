@@ -0,0 +1,91 @@
+"""Benchmarks for the Learning Journal app.
+
+Each benchmark is a module run from the project directory, e.g.:
+
+    python -m benchmarks.login
+
+Benchmarks run against a temporary database, never against journal.db.
+"""
+
+import os
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+
+def use_database(path: str, threads: int = 1) -> str:
+    """Points the app at the database at the path, and returns the path.
+
+    The data version, secret key and slow query log files are kept next to
+    the database (unless the log is set elsewhere), and the connection pool is
+    made big enough for the given number of threads.
+    Must be called before the app's modules are first imported, since they
+    read their settings from the environment.
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    os.environ.setdefault("JOURNAL_MAX_CONNECTIONS", str(max(8, threads)))
+    os.environ["JOURNAL_DATABASE"] = path
+    os.environ["JOURNAL_VERSION_FILE"] = path + "-version"
+    os.environ["JOURNAL_SECRET_KEY_FILE"] = os.path.join(directory,
+                                                         "secret_key")
+    os.environ.setdefault("JOURNAL_SLOW_QUERY_LOG",
+                          os.path.join(directory, "slow_queries.log"))
+    return path
+
+
+def use_temporary_database(directory: str = None, threads: int = 1) -> str:
+    """Points the app at a new, empty database in a temporary directory, and
+    returns the database's path.  (See use_database.)
+    """
+    directory = directory or tempfile.mkdtemp(prefix="journal-benchmark-")
+    return use_database(os.path.join(directory, "journal.db"), threads)
+
+
+class QueryCounter:
+    """Counts the statements a database executes."""
+
+    def __init__(self, database):
+        self.count = 0
+        execute_sql = database.execute_sql
+
+        def counted(*args, **kwargs):
+            self.count += 1
+            return execute_sql(*args, **kwargs)
+
+        database.execute_sql = counted
+
+
+def percentiles(samples: list, points=(50, 90, 99)) -> dict:
+    """Returns the given percentiles of the samples (nearest-rank)."""
+    samples = sorted(samples)
+    if not samples:
+        return {f"p{point}": None for point in points}
+    return {f"p{point}": samples[min(len(samples) - 1,
+                                     max(0, -(-point * len(samples) // 100) - 1))]
+            for point in points}
+
+
+def milliseconds(seconds) -> str:
+    """Formats a duration in seconds as milliseconds."""
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process so far, in bytes (or
+    None where it can't be measured).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def megabytes(size) -> str:
+    """Formats a size in bytes as MiB."""
+    return "-" if size is None else f"{size / 1024 / 1024:.1f}MiB"
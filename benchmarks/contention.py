@@ -0,0 +1,163 @@
+"""Benchmark of concurrent writes, made directly and through the write queue.
+
+Writer threads create entries as fast as they can while listing threads load
+the home page, first with each request thread writing to the database itself
+and then with the writes going through the write queue (see writes.py).  The
+throughput and latency percentiles of each are reported, with the number of
+writes which failed (e.g. with "database is locked"), e.g.:
+
+    python -m benchmarks.contention --writer-threads 16 --listing-threads 4
+
+Lower JOURNAL_BUSY_TIMEOUT (in milliseconds) to see more failed direct writes.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import benchmarks
+
+MODES = ["direct", "queued"]
+ENTRY = {
+    "title": "Contention",
+    "date": "2020-11-01",
+    "time_spent": "0:30",
+    "learned": "Take turns.",
+    "resources": "",
+    "tags": "inspire, progress, contention",
+}
+
+
+def run(writer_threads: int, listing_threads: int, seconds: float) -> dict:
+    """Runs the load in each mode, and returns the results."""
+    import app
+    import debug_test
+    import models
+    import writes
+
+    app.create_app({"WTF_CSRF_ENABLED": False})
+    with models.DATABASE.connection_context():
+        debug_test.create_database()
+    # (The app loaded its tag index before the data was there.)
+    app.data_version.bump()
+    results = {"settings": {
+        "writer_threads": writer_threads,
+        "listing_threads": listing_threads,
+        "seconds": seconds,
+        "busy_timeout": models.PRAGMAS["busy_timeout"],
+        "write_batch": writes.WRITE_BATCH,
+    }}
+    for mode in MODES:
+        if mode == "queued":
+            app.write_queue = writes.WriteQueue(models.DATABASE)
+        results[mode] = run_mode(app, writer_threads, listing_threads,
+                                 seconds)
+        if app.write_queue:
+            results[mode]["batches"] = app.write_queue.batches
+            app.write_queue.stop()
+            app.write_queue = None
+        # Each mode starts with the same entries.
+        tag_changes = []
+        with models.DATABASE.connection_context():
+            for entry in models.Entry.select().where(
+                    models.Entry.title == ENTRY["title"]):
+                tag_changes.extend(app.write(app.remove_entry, entry))
+        app.bump_data_version(tag_changes)
+    return results
+
+
+def run_mode(app, writer_threads: int, listing_threads: int,
+             seconds: float) -> dict:
+    """Runs the load in one mode, and returns the results."""
+    results = {"writes": [], "listings": [], "failed": 0}
+    lock = threading.Lock()
+    deadline = []
+
+    def start_clock():
+        deadline.append(time.monotonic() + seconds)
+
+    ready = threading.Barrier(writer_threads + listing_threads, start_clock)
+
+    def write_entries(client):
+        ready.wait()
+        while time.monotonic() < deadline[0]:
+            start = time.perf_counter()
+            try:
+                response = client.post("/entries/new", data=ENTRY)
+                succeeded = response.status_code == 302
+            except Exception:  # e.g. database is locked (when testing).
+                succeeded = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if succeeded:
+                    results["writes"].append(elapsed)
+                else:
+                    results["failed"] += 1
+
+    def list_entries():
+        client = app.app.test_client()
+        ready.wait()
+        while time.monotonic() < deadline[0]:
+            start = time.perf_counter()
+            client.get("/").get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                results["listings"].append(elapsed)
+
+    # (Logged in one at a time, since the password hashing pool turns away
+    # logins when it's busy.)
+    writers = []
+    for _ in range(writer_threads):
+        client = app.app.test_client()
+        response = client.post("/login", data={"username": "tip_of_the_day",
+                                               "password": "inspire"})
+        assert response.status_code == 302
+        writers.append(client)
+    threads = ([threading.Thread(target=write_entries, args=(client,))
+                for client in writers] +
+               [threading.Thread(target=list_entries)
+                for _ in range(listing_threads)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "writes": dict(count=len(results["writes"]),
+                       per_second=len(results["writes"]) / seconds,
+                       **benchmarks.percentiles(results["writes"])),
+        "listings": dict(count=len(results["listings"]),
+                         **benchmarks.percentiles(results["listings"])),
+        "failed": results["failed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writer-threads", type=int, default=16)
+    parser.add_argument("--listing-threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--json", help="also save the results to this file")
+    args = parser.parse_args()
+    benchmarks.use_temporary_database(
+        threads=args.writer_threads + args.listing_threads + 1)
+    results = run(args.writer_threads, args.listing_threads, args.seconds)
+    print(json.dumps(results["settings"]))
+    for mode in MODES:
+        result = results[mode]
+        print(f"{mode}:")
+        for name in ["writes", "listings"]:
+            print(f"  {name:>8}: {result[name]['count']:>6} requests  " +
+                  "  ".join(f"{key} {benchmarks.milliseconds(result[name][key])}"
+                            for key in ["p50", "p90", "p99"]))
+        print(f"  {result['writes']['per_second']:>16.1f} writes/s, "
+              f"{result['failed']} failed" +
+              (f", {result['batches']} batches" if "batches" in result
+               else ""))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Synthetic data generator for the Learning Journal app.
+
+Builds a database like journal.db, filled with made-up users and entries, for
+benchmarking at realistic sizes:
+
+    python -m benchmarks.generate --size 100k --database /tmp/100k/journal.db
+
+The same size and seed always give the same data.  Tags follow a Zipf
+distribution (a few tags are on many entries, most are on very few), a few
+heavy users write half of the entries, and some entries are private or hidden.
+Every user's password is PASSWORD, and the user "god" is god.
+"""
+
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sys
+import time
+
+import benchmarks
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SEED = 2020
+PASSWORD = "password"
+GOD = "god"
+# One user per ENTRIES_PER_USER entries; the first HEAVY_USERS of them write
+# HEAVY_SHARE of all entries between them.
+ENTRIES_PER_USER = 50
+HEAVY_USERS = 5
+HEAVY_SHARE = 0.5
+# One tag per ENTRIES_PER_TAG entries, used with Zipf-distributed frequency.
+ENTRIES_PER_TAG = 10
+ZIPF_EXPONENT = 1.1
+MAX_TAGS = 5
+PRIVATE_SHARE = 0.2
+HIDDEN_SHARE = 0.05
+FIRST_DATE = datetime.date(2010, 1, 1)
+DAYS = 10 * 365
+
+SYLLABLES = ["ba", "co", "da", "fi", "go", "ha", "ji", "ka", "lo", "mu", "na",
+             "pe", "qui", "ro", "sa", "tu", "vi", "wo", "xe", "yu", "ze", "bri",
+             "cla", "dro", "fle", "gru", "pla", "sto", "tri", "zen"]
+# Words for titles and text, most common first (they are used with Zipf-
+# distributed frequency too, so that searches have realistic match counts).
+WORDS = ["python", "learned", "today", "code", "data", "flask", "database",
+         "query", "test", "function", "class", "error", "design", "index",
+         "cache", "template", "server", "request", "model", "list", "string",
+         "loop", "module", "package", "debug", "deploy", "refactor", "review",
+         "style", "docs", "network", "thread", "process", "memory", "disk",
+         "file", "stream", "parser", "token", "grammar", "compiler", "type",
+         "schema", "migration", "backup", "security", "password", "session",
+         "cookie", "header", "route", "view", "form", "field", "widget",
+         "layout", "color", "font", "image", "sound", "video", "music",
+         "garden", "kitchen", "recipe", "bread", "coffee", "tea", "running",
+         "cycling", "swimming", "chess", "history", "physics", "chemistry",
+         "biology", "algebra", "geometry", "statistics", "probability",
+         "language", "spanish", "french", "japanese", "poetry",
+         "novel", "essay", "painting", "drawing", "pottery", "woodwork",
+         "electronics", "soldering", "robot", "sensor", "antenna", "radio"]
+
+
+class Generator:
+    """Makes the records (in the bulk import format) for a database of a given
+    number of entries.
+    """
+
+    def __init__(self, entries: int, seed: int = SEED):
+        self.entries = entries
+        self.random = random.Random(seed)
+        self.users = [GOD] + [username(number) for number in range(
+            1, max(HEAVY_USERS * 2, entries // ENTRIES_PER_USER) + 1)]
+        self.tags = self.make_tags(max(MAX_TAGS, entries // ENTRIES_PER_TAG))
+        self.tag_weights = zipf_weights(len(self.tags))
+        self.word_weights = zipf_weights(len(WORDS))
+
+    def make_tags(self, count: int) -> list:
+        """Returns count distinct made-up tag names."""
+        tags = {}
+        for length in itertools.cycle([2, 3, 4]):
+            if len(tags) == count:
+                return list(tags)
+            tag = "".join(self.random.choice(SYLLABLES)
+                          for _ in range(length))
+            tags.setdefault(tag, None)
+
+    def user_records(self, password_hash: str):
+        """Yields the users (all with the same password hash)."""
+        for name in self.users:
+            yield {"username": name, "password_hash": password_hash,
+                   "god": name == GOD}
+
+    def entry_records(self):
+        """Yields the entries."""
+        heavy = self.users[1:HEAVY_USERS + 1]
+        light = self.users[HEAVY_USERS + 1:]
+        rng = self.random
+        for _ in range(self.entries):
+            author = rng.choice(heavy if rng.random() < HEAVY_SHARE
+                                else light)
+            hidden = rng.random() < HIDDEN_SHARE
+            words = self.words(rng.randint(20, 120))
+            yield {
+                "username": author,
+                "title": " ".join(words[:rng.randint(2, 6)]).capitalize(),
+                "date": (FIRST_DATE + datetime.timedelta(
+                    days=rng.randrange(DAYS))).isoformat(),
+                "time_spent": f"{rng.randrange(8)}:{rng.randrange(60):02}",
+                "learned": " ".join(words) + ".",
+                "resources": f"https://example.com/{words[-1]}/"
+                             f"{rng.randrange(10000)}",
+                "tags": ", ".join(dict.fromkeys(rng.choices(
+                    self.tags, cum_weights=self.tag_weights,
+                    k=rng.randint(0, MAX_TAGS)))),
+                "private": hidden or rng.random() < PRIVATE_SHARE,
+                "hidden": hidden,
+            }
+
+    def words(self, count: int) -> list:
+        return self.random.choices(WORDS, cum_weights=self.word_weights,
+                                   k=count)
+
+
+def username(number: int) -> str:
+    """Returns the name of a generated user (the first HEAVY_USERS are the
+    heavy users).
+    """
+    return f"user{number:05}"
+
+
+def zipf_weights(count: int) -> list:
+    """Returns cumulative Zipf weights for count items, in rank order."""
+    return list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT
+                                     for rank in range(1, count + 1)))
+
+
+def generate(entries: int, seed: int = SEED, out=sys.stderr) -> None:
+    """Fills the app's (empty) database with generated users and entries."""
+    import bulk_import
+    import models
+    import passwords
+
+    generator = Generator(entries, seed)
+    models.initialize()
+    with models.DATABASE.connection_context():
+        importer = bulk_import.Importer(out=out)
+        # Hashing a password per user would take longer than everything else.
+        records = generator.user_records(passwords.hash_password(PASSWORD))
+        for kind, import_batch, records in [
+                ("users", importer.import_users, records),
+                ("entries", importer.import_entries,
+                 generator.entry_records())]:
+            imported = 0
+            start = time.perf_counter()
+            for batch in models.chunked(enumerate(records, 1),
+                                        importer.batch_size):
+                with models.DATABASE.atomic("IMMEDIATE"):
+                    imported += import_batch(batch)
+                if imported % (importer.batch_size * 10) == 0:
+                    importer.report_rate(kind, imported, start)
+            importer.report_rate(kind, imported, start)
+        start = time.perf_counter()
+        models.Related.rebuild()
+        importer.report(f"related entries found in "
+                        f"{time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1k",
+                        help="number of entries, or one of " +
+                             ", ".join(SIZES))
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--database", required=True,
+                        help="path of the new database")
+    args = parser.parse_args()
+    if os.path.exists(args.database):
+        parser.error(f"{args.database} already exists")
+    os.makedirs(os.path.dirname(os.path.abspath(args.database)),
+                exist_ok=True)
+    benchmarks.use_database(args.database)
+    generate(entry_count(args.size), args.seed)
+
+
+def entry_count(size: str) -> int:
+    """Reads a --size argument."""
+    return SIZES.get(size.lower()) or int(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark for logins and listings under a mixed load.
+
+Login threads log in and out as fast as they can while listing threads load
+the home page, and the latency percentiles of each are reported.  Run it with
+different JOURNAL_HASH_WORKERS, JOURNAL_HASH_QUEUE and JOURNAL_BCRYPT_ROUNDS
+settings to compare them, e.g.:
+
+    python -m benchmarks.login --login-threads 16 --listing-threads 8
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import benchmarks
+
+
+def run(login_threads: int, listing_threads: int, seconds: float) -> dict:
+    """Runs the mixed load, and returns the results."""
+    import app
+    import debug_test
+    import models
+    import passwords
+
+    app.create_app({"WTF_CSRF_ENABLED": False})
+    with models.DATABASE.connection_context():
+        debug_test.create_database()
+    # (The app loaded its tag index before the data was there.)
+    app.data_version.bump()
+    results = {"logins": [], "listings": [], "busy": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def log_in():
+        client = app.app.test_client()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.post("/login", data={"username": "god",
+                                                   "password": "iamgod"})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 302:
+                    results["logins"].append(elapsed)
+                else:
+                    results["busy"] += 1
+            client.get("/logout")
+
+    def list_entries():
+        client = app.app.test_client()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            client.get("/")
+            elapsed = time.perf_counter() - start
+            with lock:
+                results["listings"].append(elapsed)
+
+    threads = ([threading.Thread(target=log_in)
+                for _ in range(login_threads)] +
+               [threading.Thread(target=list_entries)
+                for _ in range(listing_threads)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "settings": {
+            "login_threads": login_threads,
+            "listing_threads": listing_threads,
+            "seconds": seconds,
+            "bcrypt_rounds": passwords.BCRYPT_ROUNDS,
+            "hash_workers": passwords.HASH_WORKERS,
+            "hash_queue": passwords.HASH_QUEUE,
+        },
+        "logins": dict(count=len(results["logins"]),
+                       **benchmarks.percentiles(results["logins"])),
+        "listings": dict(count=len(results["listings"]),
+                         **benchmarks.percentiles(results["listings"])),
+        "busy": results["busy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--login-threads", type=int, default=8)
+    parser.add_argument("--listing-threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--json", help="also save the results to this file")
+    args = parser.parse_args()
+    benchmarks.use_temporary_database(
+        threads=args.login_threads + args.listing_threads)
+    results = run(args.login_threads, args.listing_threads, args.seconds)
+    print(json.dumps(results["settings"]))
+    for name in ["logins", "listings"]:
+        result = results[name]
+        print(f"{name:>9}: {result['count']:>6} requests  " +
+              "  ".join(f"{key} {benchmarks.milliseconds(result[key])}"
+                        for key in ["p50", "p90", "p99"]))
+    print(f"     busy: {results['busy']:>6} logins turned away")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
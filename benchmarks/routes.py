@@ -0,0 +1,289 @@
+"""Benchmark of every route of the Learning Journal app.
+
+Drives each route through the Flask test client, as a visitor who isn't
+logged in, as a heavy author and as god, against a generated database (see
+benchmarks.generate).  Reports the latency percentiles and the number of
+queries of each route, and the peak memory use (RSS) of the process after it:
+
+    python -m benchmarks.routes --size 100k --save baseline.json
+    python -m benchmarks.routes --size 100k --compare baseline.json
+
+Use --database to reuse a database made by benchmarks.generate (the write
+routes add entries and delete them again).  The rendered listing cache is
+cleared before every request, so listings are timed as they are just after a
+write; use --warm to time cache hits instead.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import time
+
+import benchmarks
+from benchmarks import generate
+
+ROLES = ["anonymous", "author", "god"]
+# Routes read by every role:  (name, URL template).  The templates are filled
+# in from the fixture (see find_fixture).
+READS = [
+    ("index", "/"),
+    ("index (deep page)", "/?after={deep_cursor}"),
+    ("user_entries", "/entries/{author}"),
+    ("user_archive (month)", "/entries/{author}/{year}/{month}"),
+    ("archive", "/archive"),
+    ("archive (month)", "/archive/{year}/{month}"),
+    ("show_tag (common)", "/tags/{common_tag}"),
+    ("show_tag (rare)", "/tags/{rare_tag}"),
+    ("show_entry", "/entries/{entry_id}"),
+    ("search", "/search?q={word}"),
+    ("export_entries", "/entries/{author}/export"),
+    ("api entries", "/api/entries"),
+    ("api user entries", "/api/users/{author}/entries"),
+    ("api tag entries", "/api/tags/{common_tag}/entries"),
+    ("api entry", "/api/entries/{entry_id}"),
+    ("api users", "/api/users"),
+    ("api tags", "/api/tags"),
+    ("show_stats", "/stats"),
+    ("tag_cloud", "/tags"),
+    ("complete_tags", "/autocomplete/tags?q={tag_prefix}"),
+    ("login", "/login"),
+    ("register", "/register"),
+]
+# Routes read only by some roles.
+ROLE_READS = {
+    "author": [
+        ("create_entry (form)", "/entries/new"),
+        ("edit_entry (form)", "/entries/{entry_id}/edit"),
+    ],
+    "god": [
+        ("export_all", "/export"),
+    ],
+}
+# Writes are made by the author, as a create, edit and delete of one entry.
+WRITES = ["create_entry", "edit_entry", "delete_entry"]
+SUCCESS_CODES = [200, 302]
+
+
+class Route:
+    """The measurements of one route, for one role."""
+
+    def __init__(self, name: str, role: str):
+        self.name = name
+        self.role = role
+        self.times = []
+        self.queries = []
+        self.errors = 0
+        self.peak_rss = None
+
+    def result(self) -> dict:
+        return dict(
+            name=self.name, role=self.role, count=len(self.times),
+            **benchmarks.percentiles(self.times),
+            queries=max(self.queries, default=None),
+            errors=self.errors, peak_rss=self.peak_rss)
+
+
+class Runner:
+    """Times requests, and counts their queries."""
+
+    def __init__(self, app, counter: benchmarks.QueryCounter, warm: bool):
+        self.app = app
+        self.counter = counter
+        self.warm = warm
+
+    def request(self, route: Route, call):
+        """Makes a request (a call of a test client method), records its
+        measurements in the route, and returns the response.
+        """
+        if not self.warm:
+            self.app.listing_cache.clear()
+        queries = self.counter.count
+        start = time.perf_counter()
+        response = call()
+        # Streamed responses run their queries as they are read.
+        response.get_data()
+        route.times.append(time.perf_counter() - start)
+        route.queries.append(self.counter.count - queries)
+        if response.status_code not in SUCCESS_CODES:
+            route.errors += 1
+        return response
+
+
+def find_fixture(models) -> dict:
+    """Picks the users, entries and tags for the routes to use."""
+    author = generate.username(1)
+    visible = (models.Entry.hidden == False)  # noqa E712 (must use == for peewee)
+    tag_counts = (models.Tag
+                  .select(models.Tag.name)
+                  .join(models.EntryTag)
+                  .group_by(models.Tag.id))
+    middle = (models.Entry
+              .select(models.Entry.date, models.Entry.id)
+              .where(visible)
+              .order_by(models.Entry.date, models.Entry.id)
+              .offset(models.Entry.select().where(visible).count() // 2)
+              .get())
+    common_tag = tag_counts.order_by(
+        models.fn.COUNT(models.EntryTag.id).desc()).scalar()
+    return {
+        "author": author,
+        "entry_id": (models.Entry
+                     .select(models.Entry.id)
+                     .join(models.User)
+                     .where((models.User.username == author) &
+                            (models.Entry.private == False))  # noqa E712
+                     .scalar()),
+        "common_tag": common_tag,
+        "tag_prefix": common_tag[:2],
+        "rare_tag": tag_counts.order_by(
+            models.fn.COUNT(models.EntryTag.id)).scalar(),
+        "deep_cursor": models.Entry.cursor(middle.date, middle.id),
+        "word": generate.WORDS[len(generate.WORDS) // 2],
+        "year": middle.date.year,
+        "month": middle.date.month,
+    }
+
+
+def run(requests: int, warm: bool) -> dict:
+    """Benchmarks every route, and returns the results."""
+    import app
+    import models
+
+    app.create_app({"WTF_CSRF_ENABLED": False})
+    with models.DATABASE.connection_context():
+        fixture = find_fixture(models)
+        entries = models.Entry.select().count()
+    runner = Runner(app, benchmarks.QueryCounter(models.DATABASE), warm)
+    clients = {}
+    for role, username in [("anonymous", None),
+                           ("author", fixture["author"]),
+                           ("god", generate.GOD)]:
+        clients[role] = app.app.test_client()
+        if username:
+            clients[role].post("/login", data={
+                "username": username, "password": generate.PASSWORD})
+    routes = []
+    for role in ROLES:
+        client = clients[role]
+        for name, url in READS + ROLE_READS.get(role, []):
+            route = Route(name, role)
+            url = url.format(**fixture)
+            for _ in range(requests):
+                runner.request(route, lambda: client.get(url))
+            route.peak_rss = benchmarks.peak_rss()
+            routes.append(route)
+    routes.extend(run_writes(runner, clients["author"], fixture, requests))
+    return {
+        "settings": {
+            "entries": entries,
+            "requests": requests,
+            "warm": warm,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "routes": [route.result() for route in routes],
+        "peak_rss": benchmarks.peak_rss(),
+    }
+
+
+def run_writes(runner: Runner, client, fixture: dict, requests: int) -> list:
+    """Creates, edits and deletes entries as the author, and returns the
+    routes' measurements.
+    """
+    import models
+
+    routes = {name: Route(name, "author") for name in WRITES}
+    for number in range(requests):
+        form = {
+            "title": f"Benchmark entry {number}",
+            "date": "2020-10-31",
+            "time_spent": "1:00",
+            "learned": " ".join(generate.WORDS),
+            "resources": "https://example.com/",
+            # A common tag, and a new one (which is deleted with the entry).
+            "tags": f"{fixture['common_tag']}, benchmark{number}",
+        }
+        runner.request(routes["create_entry"],
+                       lambda: client.post("/entries/new", data=form))
+        with models.DATABASE.connection_context():
+            entry_id = models.Entry.select(models.fn.MAX(models.Entry.id)
+                                           ).scalar()
+        form["tags"] = fixture["common_tag"]
+        runner.request(routes["edit_entry"], lambda: client.post(
+            f"/entries/{entry_id}/edit", data=form))
+        runner.request(routes["delete_entry"], lambda: client.post(
+            f"/entries/{entry_id}/delete"))
+    for route in routes.values():
+        route.peak_rss = benchmarks.peak_rss()
+    return list(routes.values())
+
+
+def report(results: dict, baseline: dict = None) -> None:
+    """Prints the results, with the change from the baseline's if given."""
+    print(json.dumps(results["settings"]))
+    old = {(route["role"], route["name"]): route
+           for route in (baseline or {}).get("routes", [])}
+    print(f"{'role':<10}{'route':<24}{'p50':>9}{'p90':>9}{'p99':>9}"
+          f"{'queries':>9}{'peak RSS':>11}" + ("  p50 change" if old else ""))
+    for route in results["routes"]:
+        line = (f"{route['role']:<10}{route['name']:<24}" +
+                "".join(f"{benchmarks.milliseconds(route[key]):>9}"
+                        for key in ["p50", "p90", "p99"]) +
+                f"{route['queries']:>9}"
+                f"{benchmarks.megabytes(route['peak_rss']):>11}")
+        if route["errors"]:
+            line += f"  ({route['errors']} errors)"
+        previous = old.get((route["role"], route["name"]))
+        if previous:
+            line += f"  {change(previous['p50'], route['p50'])}"
+            if previous["queries"] != route["queries"]:
+                line += f" (was {previous['queries']} queries)"
+        print(line)
+    print(f"peak RSS: {benchmarks.megabytes(results['peak_rss'])}")
+
+
+def change(old, new) -> str:
+    """Formats the change from an old time to a new one, as a percentage."""
+    if not old or new is None:
+        return "-"
+    return f"{(new - old) / old:+.0%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1k",
+                        help="number of entries to generate (see "
+                             "benchmarks.generate)")
+    parser.add_argument("--seed", type=int, default=generate.SEED)
+    parser.add_argument("--database",
+                        help="use this generated database instead")
+    parser.add_argument("--requests", type=int, default=20,
+                        help="requests per route and role")
+    parser.add_argument("--warm", action="store_true",
+                        help="don't clear the listing cache between requests")
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--compare",
+                        help="compare the results with this saved JSON file")
+    args = parser.parse_args()
+    if args.database:
+        if not os.path.exists(args.database):
+            parser.error(f"{args.database} does not exist")
+        benchmarks.use_database(args.database)
+    else:
+        benchmarks.use_temporary_database()
+        generate.generate(generate.entry_count(args.size), args.seed)
+    results = run(args.requests, args.warm)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Bulk import tool for the Learning Journal app.
+
+Loads users and entries from JSON Lines (.jsonl) or CSV (.csv) files:
+
+    python bulk_import.py --users users.jsonl --entries entries.csv
+
+Users have the fields username, password (or an existing bcrypt
+password_hash) and god.  Entries have the fields username (the author), title,
+date (yyyy-mm-dd), time_spent (h:mm, or hh:mm:ss as export.py writes it),
+learned, resources, tags (separated by
+commas), private and hidden.
+
+Input is streamed, and written in batched transactions, so memory use doesn't
+grow with the size of the files.  The position in each file is saved with each
+batch, so an interrupted import picks up where it left off when run again with
+the same files (use --restart to start over; entries already in the journal,
+by the same user with the same title and date, are then skipped rather than
+imported again).
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+
+import models
+import passwords
+
+BATCH_SIZE = 1000
+# Older SQLite versions allow at most 999 parameters per statement.
+MAX_VARIABLES = 999
+TRUE_STRINGS = ["1", "true", "yes", "y", "t"]
+TIME_FORMATS = ["%H:%M", "%H:%M:%S"]
+
+
+class ImportProgress(models.Model):
+    """How many records of each input file have been imported."""
+    source = models.CharField(primary_key=True)
+    records = models.IntegerField(default=0)
+
+    class Meta:
+        database = models.DATABASE
+
+
+class Importer:
+    """Imports batches of users and entries into the database."""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, out=sys.stderr):
+        self.batch_size = batch_size
+        self.out = out
+        # Name to id maps, so that references can be resolved without queries.
+        self.user_ids = dict(models.User.select(models.User.username,
+                                                models.User.id).tuples())
+        self.tag_ids = dict(models.Tag.select(models.Tag.name,
+                                              models.Tag.id).tuples())
+        self.rejected = 0
+        self.skip_existing = False
+
+    def run(self, path: str, kind: str, restart: bool = False) -> int:
+        """Imports the users or entries (by kind) in the file, and returns the
+        number of records imported.
+        """
+        source = f"{kind}:{os.path.abspath(path)}"
+        progress, _ = ImportProgress.get_or_create(source=source)
+        if restart:
+            progress.records = 0
+        skip = progress.records
+        if skip:
+            self.report(f"{path}: resuming after record {skip}")
+        # Starting over, some of the records may already have been imported.
+        self.skip_existing = restart
+        imported = 0
+        start = time.perf_counter()
+        batch = []
+        for number, record in enumerate(read_records(path), 1):
+            if number <= skip:
+                continue
+            batch.append((number, record))
+            if len(batch) == self.batch_size:
+                imported += self.commit(kind, batch, progress)
+                self.report_rate(path, imported, start)
+                batch = []
+        if batch:
+            imported += self.commit(kind, batch, progress)
+        self.report_rate(path, imported, start)
+        return imported
+
+    def commit(self, kind: str, batch: list, progress) -> int:
+        """Imports a batch of users or entries (by kind), and saves the
+        position in the file, in one transaction.  Returns the number of
+        records imported.
+        """
+        position = batch[-1][0]
+        if kind == "users":
+            # bcrypt is slow, so passwords are hashed before the transaction
+            # takes the write lock.
+            batch = self.hash_passwords(batch)
+            import_batch = self.import_users
+        else:
+            import_batch = self.import_entries
+        with models.DATABASE.atomic("IMMEDIATE"):
+            imported = import_batch(batch)
+            progress.records = position
+            progress.save()
+        return imported
+
+    def hash_passwords(self, batch: list) -> list:
+        """Returns the batch of users without those which are already in the
+        database (or earlier in the batch), with their passwords hashed.
+
+        Raises passwords.Busy if a password can't be hashed in time.
+        """
+        hashed = []
+        usernames = set()
+        for number, record in batch:
+            try:
+                username = record["username"]
+                if username in self.user_ids or username in usernames:
+                    continue
+                password_hash = (record.get("password_hash") or
+                                 passwords.hash_password(record["password"]))
+            except (KeyError, TypeError):
+                self.reject(number, "a user needs a username and password")
+                continue
+            usernames.add(username)
+            hashed.append((number, dict(record, password_hash=password_hash)))
+        return hashed
+
+    def import_users(self, batch: list) -> int:
+        """Imports a batch of users (with their passwords hashed)."""
+        rows = []
+        for _, record in batch:
+            username = record["username"]
+            if username in self.user_ids:
+                continue
+            rows.append({"username": username,
+                         "password": record["password_hash"],
+                         "god": to_bool(record.get("god"))})
+            # Mark the name as taken until its id is known.
+            self.user_ids[username] = None
+        for chunk in chunks(rows, 3):
+            models.User.insert_many(chunk).on_conflict_ignore().execute()
+            self.user_ids.update(
+                models.User.select(models.User.username, models.User.id)
+                .where(models.User.username.in_(
+                    [row["username"] for row in chunk])).tuples())
+        return len(rows)
+
+    def import_entries(self, batch: list) -> int:
+        now = models.utcnow()
+        entries = []
+        for number, record in batch:
+            try:
+                user_id = self.user_ids[record["username"]]
+                hidden = to_bool(record.get("hidden"))
+                entry = {
+                    "user": user_id,
+                    "title": record["title"],
+                    "date": datetime.date.fromisoformat(record["date"]),
+                    "time_spent": to_time(record.get("time_spent") or "0:00"),
+                    "learned": record["learned"],
+                    "resources": record.get("resources") or "",
+                    "tags": record.get("tags") or "",
+                    # All hidden entries are also private.
+                    "private": hidden or to_bool(record.get("private")),
+                    "hidden": hidden,
+                    "modified": now,
+                }
+            except KeyError as error:
+                self.reject(number, f"missing or unknown {error}")
+                continue
+            except (TypeError, ValueError) as error:
+                self.reject(number, str(error))
+                continue
+            entries.append(entry)
+        if self.skip_existing:
+            entries = self.new_entries(entries)
+        if not entries:
+            return 0
+        # Ids are assigned here (inside the batch's transaction, which holds
+        # the write lock), so that tag links can be made without reading the
+        # entries back.
+        first_id = (models.Entry.select(models.fn.MAX(models.Entry.id))
+                    .scalar() or 0) + 1
+        links = []
+        for entry_id, entry in enumerate(entries, first_id):
+            entry["id"] = entry_id
+            for tag in dict.fromkeys(tag.strip()
+                                     for tag in entry["tags"].split(",")):
+                if tag:
+                    links.append((entry_id, tag))
+        for chunk in chunks(entries, len(entries[0])):
+            models.Entry.insert_many(chunk).execute()
+        for chunk in chunks(entries, 4):
+            models.EntryIndex.insert_many(
+                [{"rowid": entry["id"], "title": entry["title"],
+                  "learned": entry["learned"], "resources": entry["resources"]}
+                 for entry in chunk]).execute()
+        new_tags = list(dict.fromkeys(tag for _, tag in links
+                                      if tag not in self.tag_ids))
+        for chunk in chunks(new_tags, 2):
+            models.Tag.insert_many(
+                [{"name": tag, "key": models.Tag.make_key(tag)}
+                 for tag in chunk]).on_conflict_ignore().execute()
+            self.tag_ids.update(
+                models.Tag.select(models.Tag.name, models.Tag.id)
+                .where(models.Tag.name.in_(chunk)).tuples())
+        for chunk in chunks(links, 2):
+            models.EntryTag.insert_many(
+                [(entry_id, self.tag_ids[tag]) for entry_id, tag in chunk],
+                fields=[models.EntryTag.entry, models.EntryTag.tag]
+            ).on_conflict_ignore().execute()
+        models.Rollup.add_matching(
+            models.Entry.id.between(entries[0]["id"], entries[-1]["id"]))
+        return len(entries)
+
+    def new_entries(self, entries: list) -> list:
+        """Returns the entries without those already in the database (by the
+        same user, with the same title and date).
+        """
+        existing = set()
+        for chunk in chunks(entries, 1):
+            existing.update(
+                models.Entry.select(models.Entry.user, models.Entry.title,
+                                    models.Entry.date)
+                .where(models.Entry.title.in_(
+                    [entry["title"] for entry in chunk])).tuples())
+        new = []
+        for entry in entries:
+            key = (entry["user"], entry["title"], entry["date"])
+            if key not in existing:
+                new.append(entry)
+        return new
+
+    def reject(self, number: int, reason: str) -> None:
+        self.rejected += 1
+        self.report(f"record {number} skipped: {reason}")
+
+    def report_rate(self, path: str, imported: int, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        rate = imported / elapsed if elapsed else 0
+        self.report(f"{path}: {imported} records imported ({rate:,.0f}/s)")
+
+    def report(self, message: str) -> None:
+        print(message, file=self.out, flush=True)
+
+
+def chunks(rows: list, columns: int):
+    """Splits rows into chunks small enough to insert in one statement."""
+    return models.chunked(rows, MAX_VARIABLES // columns)
+
+
+def read_records(path: str):
+    """Yields the records in a JSON Lines or CSV file, one at a time."""
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def to_time(value: str) -> datetime.time:
+    """Reads a time spent, as h:mm or hh:mm:ss."""
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, time_format).time()
+        except ValueError:
+            pass
+    raise ValueError(f"time spent {value!r} isn't h:mm or hh:mm:ss")
+
+
+def to_bool(value) -> bool:
+    """Reads a boolean field (as JSON, or as CSV text)."""
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_STRINGS
+    return bool(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk import users and entries into the journal.")
+    parser.add_argument("--users", help="file of users (.jsonl or .csv)")
+    parser.add_argument("--entries", help="file of entries (.jsonl or .csv)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the saved positions in the files")
+    args = parser.parse_args()
+    if not (args.users or args.entries):
+        parser.error("nothing to import")
+    models.initialize()
+    with models.DATABASE.connection_context():
+        models.DATABASE.create_tables([ImportProgress], safe=True)
+        importer = Importer(args.batch_size)
+        stopped = None
+        try:
+            if args.users:
+                importer.run(args.users, "users", args.restart)
+        except passwords.Busy:
+            # The batches already committed are kept.
+            stopped = "passwords took too long to hash; run again to resume"
+        if args.entries and not stopped:
+            importer.run(args.entries, "entries", args.restart)
+            # (Related entries are worked out for all the entries at once.)
+            importer.report("finding related entries")
+            models.Related.rebuild()
+    # Let running instances of the app know the data has changed.
+    models.data_version.bump()
+    if importer.rejected:
+        print(f"{importer.rejected} records skipped", file=sys.stderr)
+    if stopped:
+        sys.exit(stopped)
+
+
+if __name__ == "__main__":
+    main()
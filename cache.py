@@ -0,0 +1,193 @@
+"""Cache module for the Learning Journal app."""
+
+import bisect
+import collections
+import heapq
+import os
+import threading
+import time
+import uuid
+
+
+class LRUCache:
+    """A thread-safe cache holding at most max_size items.
+
+    When the cache is full, the least recently used item is discarded to make
+    room for a new one.  If ttl is given, items also expire that many seconds
+    after they are cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for the key, or default if not cached."""
+        with self._lock:
+            try:
+                value, expires = self._items[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        """Caches the value for the key."""
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key) -> None:
+        """Removes the key from the cache, if it is there."""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        """Empties the cache."""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PrefixIndex:
+    """A thread-safe in-memory index of names and counts, for finding the
+    names which start with a prefix without querying the database.
+
+    Names are kept in a sorted array of their keys (by default, the names
+    case-folded), so a prefix search is a binary search and a scan of the
+    matching keys.  Names which share a key are counted together, under the
+    most used of them.  version records the data version the index was loaded
+    from (see DataVersion), once it has been loaded.
+    """
+
+    def __init__(self, key=str.casefold):
+        self.key = key
+        self.loaded = False
+        self.version = None
+        self._keys = []
+        # {key: {name: count}}
+        self._names = {}
+        # Results of top(), by limit, until the counts change.
+        self._top = {}
+        self._lock = threading.Lock()
+
+    def load(self, counts, version=None) -> None:
+        """Replaces the contents of the index with (name, count) pairs."""
+        names = {}
+        for name, count in counts:
+            if count > 0:
+                names.setdefault(self.key(name), {})[name] = count
+        with self._lock:
+            self._names = names
+            self._keys = sorted(names)
+            self._top.clear()
+            self.loaded = True
+            self.version = version
+
+    def change(self, name: str, delta: int) -> None:
+        """Adds delta (which may be negative) to the name's count."""
+        key = self.key(name)
+        with self._lock:
+            self._top.clear()
+            names = self._names.get(key)
+            if names is None:
+                if delta <= 0:
+                    return
+                names = self._names[key] = {}
+                bisect.insort(self._keys, key)
+            count = names.get(name, 0) + delta
+            if count > 0:
+                names[name] = count
+            else:
+                names.pop(name, None)
+            if not names:
+                del self._names[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def advance(self, old, new) -> None:
+        """Moves the index to a new data version, if it was current for the
+        old one (that is, the only change between them was made through
+        change()).
+        """
+        with self._lock:
+            if self.version == old:
+                self.version = new
+
+    def complete(self, prefix: str, limit: int) -> list:
+        """Returns up to limit (name, count) pairs for the keys which start
+        with the prefix, most used first.
+        """
+        prefix = self.key(prefix)
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            # The matching keys follow each other from there.
+            end = start
+            while end < len(self._keys) and self._keys[end].startswith(prefix):
+                end += 1
+            return self._most_used(self._keys[start:end], limit)
+
+    def top(self, limit: int) -> list:
+        """Returns up to limit (name, count) pairs, most used first."""
+        with self._lock:
+            if limit not in self._top:
+                self._top[limit] = self._most_used(self._keys, limit)
+            return self._top[limit]
+
+    def _most_used(self, keys: list, limit: int) -> list:
+        entries = []
+        for key in keys:
+            names = self._names[key]
+            name = max(names, key=lambda name: (names[name], name))
+            entries.append((name, sum(names.values())))
+        # Ties are broken by key order (nlargest is stable).
+        return heapq.nlargest(limit, entries, key=lambda entry: entry[1])
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class DataVersion:
+    """Identifies the current version of the journal's data.
+
+    The version is kept as a stamp file, which is replaced after every write,
+    so that all worker processes see the same version without querying the
+    database.  Cache keys which include it stop matching anything rendered
+    from older data.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @property
+    def value(self) -> str:
+        """The current version (the random token in the stamp file)."""
+        try:
+            with open(self.path) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def bump(self) -> tuple:
+        """Changes the version, and returns the versions before and after.
+
+        Writes a new token into a new stamp file and moves it into place, so
+        that readers never see a partly written token.  (The file's inode and
+        modified time can repeat, but the token doesn't.)
+        """
+        old = self.value
+        new = uuid.uuid4().hex
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, "w") as file:
+            file.write(new)
+        os.replace(temp_path, self.path)
+        return old, new
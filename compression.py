@@ -0,0 +1,49 @@
+"""Response compression module for the Learning Journal app.
+
+gzip_response() compresses a response on the fly if the client accepts it.
+Streamed responses are compressed chunk by chunk, and each chunk is flushed
+through the compressor, so that the client still gets each part of the page as
+soon as it is rendered.
+"""
+
+import zlib
+
+from flask import request
+
+# Only these types are compressed (static files are pre-compressed; see
+# assets.py).
+MIMETYPES = {"text/html", "text/plain", "text/csv", "application/json",
+             "application/x-ndjson"}
+# Smaller (non-streamed) responses aren't worth compressing.
+MIN_SIZE = 512
+LEVEL = 6
+
+
+def gzip_response(response):
+    """Returns the response, gzip-compressed if the client accepts it."""
+    if (response.mimetype not in MIMETYPES or response.direct_passthrough or
+            "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if ("gzip" not in request.accept_encodings or
+            not 200 <= response.status_code < 300 or
+            not response.is_streamed and
+            len(response.get_data()) < MIN_SIZE):
+        return response
+    if response.is_streamed:
+        response.response = compress(response.iter_encoded())
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(b"".join(compress([response.get_data()])))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def compress(chunks):
+    """Yields the chunks (of bytes) gzip-compressed, flushing each one."""
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if chunk:
+            yield (compressor.compress(chunk) +
+                   compressor.flush(zlib.Z_SYNC_FLUSH))
+    yield compressor.flush()
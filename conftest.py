@@ -0,0 +1,74 @@
+"""Test fixtures for the Learning Journal app.
+
+The tests run against a temporary database seeded from debug_test.py, never
+against journal.db.  The environment is set here, before any of the app's
+modules are imported, since they read their settings from it.
+"""
+
+import os
+
+import pytest
+
+import benchmarks
+from tests.data import USERS
+
+benchmarks.use_temporary_database()
+# The cheapest bcrypt cost, and no slow query log.
+os.environ["JOURNAL_BCRYPT_ROUNDS"] = "4"
+os.environ["JOURNAL_SLOW_QUERY_MS"] = "0"
+
+# debug_test.py isn't a test module, and imports the models too early.
+collect_ignore = ["debug_test.py"]
+
+
+@pytest.fixture(scope="session")
+def journal():
+    """The app module, with its database seeded from debug_test.py."""
+    import app
+    import debug_test
+    import models
+
+    app.create_app({"WTF_CSRF_ENABLED": False, "TESTING": True})
+    with models.DATABASE.connection_context():
+        debug_test.create_database()
+    # (The app loaded its tag index before the data was there.)
+    app.data_version.bump()
+    return app
+
+
+@pytest.fixture(scope="session")
+def query_counter(journal):
+    return benchmarks.QueryCounter(journal.models.DATABASE)
+
+
+@pytest.fixture(scope="session")
+def clients(journal):
+    """A test client for each role, logged in as its user."""
+    clients = {}
+    for role, login in USERS.items():
+        clients[role] = journal.app.test_client()
+        if login:
+            response = clients[role].post("/login", data={
+                "username": login[0], "password": login[1]})
+            assert response.status_code == 302
+    return clients
+
+
+@pytest.fixture
+def count_queries(journal, query_counter):
+    """Returns a function which makes a request (a call of a test client
+    method) with cold caches, and returns the response and the number of
+    statements it executed.
+    """
+
+    def count_queries(call):
+        journal.listing_cache.clear()
+        journal.models.user_cache.clear()
+        journal.tag_index.loaded = False
+        start = query_counter.count
+        response = call()
+        # Streamed responses run their queries as they are read.
+        response.get_data()
+        return response, query_counter.count - start
+
+    return count_queries
@@ -159,6 +159,7 @@ def create_database():
             tags=tags,
             private=private,
             hidden=hidden)
+        models.EntryIndex.add(entry)
         # Tags need to be added to the Tag and EntryTag tables.  Searches for
         # tags may be case-insensitive, but actual tags will be stored as-is.
         if tags:
@@ -170,6 +171,8 @@ def create_database():
                 except models.DoesNotExist:
                     tag = models.Tag.create(name=tag)
                 models.EntryTag.create(entry=entry, tag=tag)
+        models.Rollup.add(entry)
+        models.Related.refresh(entry)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+"""Export module for the Learning Journal app.
+
+Streams journal entries as JSON Lines, CSV, or a zipped bundle of Markdown
+files, one entry at a time, so that memory use is the same for ten entries or
+ten million.  Used by the app's export routes, and from the command line:
+
+    python export.py --user crashtestdummy --format csv > entries.csv
+
+(The command line exports every entry of the user, or of every user if no
+user is given.)
+"""
+
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+import zipfile
+
+import models
+
+FORMATS = {
+    # Format: (file extension, MIME type)
+    "jsonl": ("jsonl", "application/x-ndjson"),
+    "csv": ("csv", "text/csv"),
+    "markdown": ("zip", "application/zip"),
+}
+FIELDS = ["id", "username", "title", "date", "time_spent", "learned",
+          "resources", "tags", "private", "hidden"]
+
+
+def entries(username: str = None, where=None):
+    """Yields the entries to export, as dicts in date order.
+
+    Exports one user's entries if a username is given, and only the entries
+    matching the where predicate if one is given.  The query runs when the
+    first entry is requested, and the rows are read from the database cursor
+    as they are needed, without being cached.
+    """
+    query = (models.Entry
+             .select(models.Entry.id, models.User.username, models.Entry.title,
+                     models.Entry.date, models.Entry.time_spent,
+                     models.Entry.learned, models.Entry.resources,
+                     models.Entry.tags, models.Entry.private,
+                     models.Entry.hidden)
+             .join(models.User)
+             .order_by(models.Entry.date.asc(), models.Entry.id.asc()))
+    if username is not None:
+        query = query.where(models.User.username == username)
+    if where is not None:
+        query = query.where(where)
+    yield from query.dicts().iterator()
+
+
+def to_text(value) -> str:
+    """Turns dates and times into text, leaving other values alone."""
+    return value if isinstance(value, (str, int, bool)) else str(value)
+
+
+def jsonl(rows):
+    """Yields the rows as lines of JSON."""
+    for row in rows:
+        yield json.dumps({key: to_text(value) for key, value in row.items()},
+                         ensure_ascii=False) + "\n"
+
+
+def csv_lines(rows):
+    """Yields the rows as CSV lines (starting with a header line)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def markdown(row: dict) -> str:
+    """Returns an entry as a Markdown document."""
+    tags = ", ".join(tag.strip() for tag in row["tags"].split(",")
+                     if tag.strip())
+    return (f"# {row['title']}\n\n"
+            f"*By {row['username']}, {row['date']}*  \n"
+            f"*Time spent: {str(row['time_spent'])[:5]}*  \n"
+            f"*Tags: {tags or 'none'}*\n\n"
+            f"## What I learned\n\n{row['learned']}\n\n"
+            f"## Resources\n\n{row['resources']}\n")
+
+
+class _Chunks(io.RawIOBase):
+    """An unseekable file which collects what is written to it, so that a zip
+    file can be streamed as it is built.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def markdown_bundle(rows):
+    """Yields a zip file of the rows as Markdown documents, in chunks."""
+    output = _Chunks()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for row in rows:
+            slug = re.sub(r"[^a-z0-9]+", "-", row["title"].lower()).strip("-")
+            bundle.writestr(f"{row['date']}-{row['id']}-{slug or 'entry'}.md",
+                            markdown(row))
+            yield output.take()
+    yield output.take()
+
+
+def filename(name: str, export_format: str) -> str:
+    """Returns the file name for an export of the name (e.g. the username), in
+    the export format, with only characters safe in a Content-Disposition
+    header.
+    """
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("._")
+    return f"{safe or 'journal'}.{FORMATS[export_format][0]}"
+
+
+def stream(rows, export_format: str):
+    """Yields the rows in the export format ("jsonl", "csv" or "markdown")."""
+    if export_format == "jsonl":
+        return jsonl(rows)
+    elif export_format == "csv":
+        return csv_lines(rows)
+    elif export_format == "markdown":
+        return markdown_bundle(rows)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def write(output, username: str, export_format: str) -> None:
+    """Writes the entries (of one user, or of every user) to a binary file in
+    the export format.
+    """
+    with models.DATABASE.connection_context():
+        for chunk in stream(entries(username), export_format):
+            output.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export journal entries.")
+    parser.add_argument("--user", help="export only this user's entries")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+    if args.output:
+        with open(args.output, "wb") as output:
+            write(output, args.user, args.format)
+    else:
+        write(sys.stdout.buffer, args.user, args.format)
+        sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
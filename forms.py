@@ -68,7 +68,10 @@ class EntryForm(FlaskForm):
     learned = TextAreaField("What You Learned", validators=[InputRequired()])
     resources = TextAreaField("Resources to Remember")
     tags = StringField("Tags",
-                       description=" (Please enter tags separated by commas.)")
+                       description=" (Please enter tags separated by commas.)",
+                       # Suggestions are filled in by static/js/tags.js.
+                       render_kw={"list": "tag-suggestions",
+                                  "autocomplete": "off"})
     private = BooleanField("Private", default=False,
                            description=" (Private entries cannot be read by "
                                        "anyone but you.)")
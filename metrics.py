@@ -0,0 +1,215 @@
+"""Metrics module for the Learning Journal app.
+
+Measures each request's total latency, the number of SQL statements it runs,
+the time they take and the time spent rendering templates, and keeps them in
+histograms by route (the endpoint name).  render() returns the histograms in
+the Prometheus text format, for the /metrics page.
+
+Each worker process keeps its own histograms, so with several workers each
+scrape sees only the requests of the worker that answered it.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+import jinja2
+
+# Set JOURNAL_SERVER_TIMING=1 to add a Server-Timing header (the time spent
+# in SQL and templates) to every response, for the browser's dev tools.
+SERVER_TIMING = os.environ.get("JOURNAL_SERVER_TIMING", "0") == "1"
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    """A thread-safe Prometheus histogram, with one set of buckets per
+    route.
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, value: float) -> None:
+        with self._lock:
+            counts, total = self._routes.get(
+                route, ([0] * (len(self.buckets) + 1), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            # The last count is the +Inf bucket (every observation).
+            counts[-1] += 1
+            self._routes[route] = (counts, total + value)
+
+    def render(self) -> list:
+        """Returns the lines of the histogram in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            routes = sorted((route, list(counts), total)
+                            for route, (counts, total) in self._routes.items())
+        for route, counts, total in routes:
+            label = f'route="{escape(route)}"'
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} '
+                             f'{count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {counts[-1]}")
+        return lines
+
+
+class Timings:
+    """The measurements of one request so far."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.rendering = False
+
+
+@contextlib.contextmanager
+def rendering():
+    """Adds the time spent in the block to the current request's render time,
+    less any time spent executing SQL (and not again for nested blocks, as
+    when a streamed template pulls in another).
+    """
+    timings = current_timings()
+    if timings is None or timings.rendering:
+        yield
+        return
+    timings.rendering = True
+    start = time.perf_counter()
+    sql = timings.sql
+    try:
+        yield
+    finally:
+        timings.rendering = False
+        timings.render += time.perf_counter() - start - (timings.sql - sql)
+
+
+class TimedTemplate(jinja2.Template):
+    """A template which adds its rendering time to the request's timings."""
+
+    def render(self, *args, **kwargs):
+        with rendering():
+            return super().render(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        # Only the time spent producing each piece is counted, not the time
+        # the consumer takes between pieces.  (Pieces are small, so this
+        # avoids the overhead of rendering() for each.)
+        pieces = super().generate(*args, **kwargs)
+        timings = current_timings()
+        if timings is None or timings.rendering:
+            yield from pieces
+            return
+        while True:
+            timings.rendering = True
+            start = time.perf_counter()
+            sql = timings.sql
+            piece = next(pieces, None)
+            timings.render += time.perf_counter() - start - (timings.sql - sql)
+            timings.rendering = False
+            if piece is None:
+                return
+            yield piece
+
+
+request_seconds = Histogram(
+    "journal_request_seconds", "Time to handle a request.", SECONDS_BUCKETS)
+request_queries = Histogram(
+    "journal_request_queries", "SQL statements run by a request.",
+    QUERY_BUCKETS)
+request_sql_seconds = Histogram(
+    "journal_request_sql_seconds", "Time a request spent executing SQL.",
+    SECONDS_BUCKETS)
+request_render_seconds = Histogram(
+    "journal_request_render_seconds",
+    "Time a request spent rendering templates.", SECONDS_BUCKETS)
+HISTOGRAMS = [request_seconds, request_queries, request_sql_seconds,
+              request_render_seconds]
+
+
+def instrument(app, database) -> None:
+    """Times the app's templates and the database's statements."""
+    app.jinja_env.template_class = TimedTemplate
+    execute_sql = database.execute_sql
+
+    def timed_execute_sql(sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute_sql(sql, *args, **kwargs)
+        finally:
+            timings = current_timings()
+            if timings:
+                timings.queries += 1
+                timings.sql += time.perf_counter() - start
+
+    database.execute_sql = timed_execute_sql
+
+
+def start_request() -> None:
+    """Starts measuring the current request."""
+    g.timings = Timings()
+
+
+def finish_request(route: str, response):
+    """Records the current request's measurements under the route, adds the
+    Server-Timing header to the response if it is enabled, and returns the
+    response.
+
+    The body of a streamed response is produced after this, so its request is
+    recorded once the body has been sent (but its Server-Timing header only
+    covers the time until the body starts).
+    """
+    timings = current_timings()
+    if timings is None:
+        return response
+    if response.is_streamed:
+        response.call_on_close(lambda: record(route, timings))
+    else:
+        record(route, timings)
+    if SERVER_TIMING:
+        total = time.perf_counter() - timings.start
+        response.headers["Server-Timing"] = (
+            f'sql;dur={timings.sql * 1000:.1f};desc="{timings.queries} '
+            f'queries", render;dur={timings.render * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}')
+    return response
+
+
+def record(route: str, timings: Timings) -> None:
+    """Records a finished request's measurements under the route."""
+    request_seconds.observe(route, time.perf_counter() - timings.start)
+    request_queries.observe(route, timings.queries)
+    request_sql_seconds.observe(route, timings.sql)
+    request_render_seconds.observe(route, timings.render)
+
+
+def current_timings():
+    """Returns the current request's timings (None outside of requests)."""
+    return g.get("timings") if has_app_context() else None
+
+
+def render() -> str:
+    """Returns every histogram in the Prometheus text format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    """Escapes a Prometheus label value."""
+    return (value.replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
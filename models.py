@@ -1,12 +1,74 @@
 """Model module for the Learning Journal app."""
 
 import datetime
-from flask_bcrypt import generate_password_hash
+import os
+import re
 from flask_login import UserMixin
 
 from peewee import *
+from playhouse.migrate import migrate, SqliteMigrator
+from playhouse.pool import PooledSqliteDatabase
+from playhouse.sqlite_ext import FTS5Model, RowIDField, SearchField
 
-DATABASE = SqliteDatabase("journal.db")
+import cache
+import passwords
+
+# Database settings.  Each can be overridden with an environment variable.
+DATABASE_NAME = os.environ.get("JOURNAL_DATABASE", "journal.db")
+VERSION_FILE = os.environ.get("JOURNAL_VERSION_FILE",
+                              DATABASE_NAME + "-version")
+MAX_CONNECTIONS = int(os.environ.get("JOURNAL_MAX_CONNECTIONS", 8))
+STALE_TIMEOUT = int(os.environ.get("JOURNAL_STALE_TIMEOUT", 300))
+PRAGMAS = {
+    # Readers are not blocked by a writer in write-ahead-log mode, and syncing
+    # only at checkpoints is safe there.
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # Page cache (negative values are in KiB) and memory-mapped I/O sizes.
+    "cache_size": -int(os.environ.get("JOURNAL_CACHE_KB", 16 * 1024)),
+    "mmap_size": int(os.environ.get("JOURNAL_MMAP_BYTES", 64 * 1024 * 1024)),
+    # Milliseconds to wait for a lock before giving up.
+    "busy_timeout": int(os.environ.get("JOURNAL_BUSY_TIMEOUT", 5000)),
+}
+
+# Related entries kept for each entry, and the number of entries above which a
+# tag is too common to relate entries.
+RELATED_COUNT = int(os.environ.get("JOURNAL_RELATED_COUNT", 10))
+RELATED_MAX_TAG_ENTRIES = int(os.environ.get("JOURNAL_RELATED_MAX_TAG_ENTRIES",
+                                             500))
+
+# User records are cached for up to USER_CACHE_TTL seconds.
+USER_CACHE_SIZE = int(os.environ.get("JOURNAL_USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL = int(os.environ.get("JOURNAL_USER_CACHE_TTL", 300))
+
+# Connections are pooled, and the pragmas are applied whenever the pool opens a
+# new one.  (Pooled connections may be handed to a different thread.)
+DATABASE = PooledSqliteDatabase(
+    DATABASE_NAME,
+    max_connections=MAX_CONNECTIONS,
+    stale_timeout=STALE_TIMEOUT,
+    pragmas=PRAGMAS,
+    check_same_thread=False)
+data_version = cache.DataVersion(VERSION_FILE)
+"""Bumped after every write to entries or tags, by the app (in any worker
+process) or by a command line tool, so that the app's caches stop matching.
+"""
+
+
+def parse_id(text) -> int:
+    """Returns the id written in text.
+
+    Raises ValueError if it isn't an integer SQLite can store (in 64 bits).
+    """
+    value = int(text)
+    if not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError(f"id out of range: {text}")
+    return value
+
+
+def utcnow():
+    """Returns the current UTC time, without time zone info (as stored)."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 
 class User(UserMixin, Model):
@@ -18,21 +80,114 @@ class User(UserMixin, Model):
     class Meta:
         database = DATABASE
 
+    @classmethod
+    def get_cached(cls, user_id):
+        """Returns the user with the id, from the user cache if possible.
+
+        Raises DoesNotExist if there is no such user.
+        """
+        user_id = int(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = cls.get(cls.id == user_id)
+            user_cache.set(user_id, user)
+        return user
+
+    @staticmethod
+    def forget(user_id):
+        """Removes the user from the user cache.
+
+        Saving or deleting a user does this automatically; call it after
+        changing users any other way (e.g. with User.update()).  Other worker
+        processes keep their copies until they expire.
+        """
+        user_cache.delete(int(user_id))
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        self.forget(self.id)
+        return result
+
+    def delete_instance(self, *args, **kwargs):
+        result = super().delete_instance(*args, **kwargs)
+        self.forget(self.id)
+        return result
+
     @classmethod
     def create_user(cls, username, password, god):
+        """Creates a user.
+
+        Raises passwords.Busy if the password can't be hashed right now.
+        """
+        cls.add_user(username, passwords.hash_password(password), god)
+
+    @classmethod
+    def add_user(cls, username, password_hash, god):
+        """Creates a user with an already hashed password (unless the username
+        is taken).
+        """
         try:
-            with DATABASE.transaction():
+            # (A savepoint, if already in a transaction.)
+            with DATABASE.atomic():
                 cls.create(
                     username=username,
-                    password=generate_password_hash(password),
+                    password=password_hash,
                     god=god
                 )
         except IntegrityError:
             # raise ValueError("User already exists.")
             pass
 
+    def check_password(self, password):
+        """Returns True if the password is the user's password.
+
+        Raises passwords.Busy if the password can't be checked right now.
+        """
+        return passwords.check_password(self.password, password)
+
+    def rehash_password(self, password):
+        """Rehashes the (correct) password at the bcrypt cost now configured,
+        if the stored hash was made at a different cost (and the hashing pool
+        isn't too busy).  Returns True if it was rehashed, and so needs to be
+        saved (with save_password).
+        """
+        if not passwords.needs_rehash(self.password):
+            return False
+        try:
+            self.password = passwords.hash_password(password)
+        except passwords.Busy:
+            return False
+        return True
+
+    def save_password(self):
+        """Write job which saves the user's password hash."""
+        self.save(only=[User.password])
+
+
+user_cache = cache.LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+"""User records by id, for loading the logged-in user on each request."""
+
+
+class HiddenMixin:
+    """Visibility rule for models with the user and hidden fields of entries
+    (entries themselves, and their rollups by author).
+    """
+
+    @classmethod
+    def visible_to(cls, user):
+        """Returns a predicate for the rows (of entries, or counting entries)
+        which appear in the user's listings.
+
+        Hidden entries appear only to their author (and to god).
+        """
+        if not user.is_authenticated:
+            return cls.hidden == False  # noqa E712 (must use == for peewee)
+        elif user.god:
+            return SQL("1")
+        return (cls.hidden == False) | (cls.user == user.id)  # noqa
+
 
-class Entry(Model):
+class Entry(HiddenMixin, Model):
     id = AutoField()
     user = ForeignKeyField(User, backref="entries")
     title = CharField(max_length=256)
@@ -43,9 +198,63 @@ class Entry(Model):
     tags = CharField(max_length=256)
     private = BooleanField(default=False)
     hidden = BooleanField(default=False)
+    # When the entry was last saved (UTC).
+    modified = DateTimeField(default=utcnow)
 
     class Meta:
         database = DATABASE
+        # Listings are ordered (and paginated) by date, then id.
+        indexes = (
+            (("date", "id"), False),
+            (("user", "date", "id"), False),
+        )
+
+    def save(self, *args, **kwargs):
+        self.modified = utcnow()
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def readable_by(cls, user):
+        """Returns a predicate for the entries which the user may read.
+
+        Private (and hidden) entries may be read only by their author (and by
+        god).
+        """
+        if not user.is_authenticated:
+            return cls.private == False  # noqa E712 (must use == for peewee)
+        elif user.god:
+            return SQL("1")
+        return (cls.private == False) | (cls.user == user.id)  # noqa
+
+    @classmethod
+    def after(cls, cursor):
+        """Returns a predicate for the entries which follow the cursor (an
+        entry's date and id, separated by a comma) in listing order.
+
+        Raises ValueError if the cursor is malformed.
+        """
+        date, entry_id = cursor.split(",")
+        return (Tuple(cls.date, cls.id) >
+                Tuple(datetime.date.fromisoformat(date).isoformat(),
+                      parse_id(entry_id)))
+
+    @staticmethod
+    def cursor(date, entry_id):
+        """Returns the listing cursor for an entry's date and id."""
+        return f"{date.isoformat()},{entry_id}"
+
+    @classmethod
+    def listing(cls):
+        """Returns a query for entry listings.
+
+        Selects only the columns displayed by the listing macro, and joins each
+        entry's author so that it is fetched in the same query.
+        """
+        return (cls
+                .select(cls.id, cls.title, cls.date, cls.private, cls.hidden,
+                        User.id, User.username)
+                .join(User)
+                )
 
     def get_tags(self):
         return (Tag
@@ -60,19 +269,47 @@ class Entry(Model):
 class Tag(Model):
     id = AutoField()
     name = CharField(max_length=256, unique=True)
+    # Case-folded name, so that tag lookups can use an index.
+    key = CharField(max_length=256, index=True)
 
     class Meta:
         database = DATABASE
 
+    @staticmethod
+    def make_key(name):
+        """Returns the lookup key for a tag name."""
+        return name.strip().casefold()
+
+    def save(self, *args, **kwargs):
+        self.key = self.make_key(self.name)
+        return super().save(*args, **kwargs)
+
     def entries(self):
         return (Entry
                 .select()
                 .join(EntryTag)
                 .join(Tag)
-                .where(Tag.name ** self.name)
+                .where(Tag.key == self.key)
                 .order_by(Entry.date.desc())
                 )
 
+    @classmethod
+    def tagged(cls, name):
+        """Returns a predicate for the entries with any variation of the tag
+        name.
+        """
+        return Entry.id.in_(EntryTag
+                            .select(EntryTag.entry)
+                            .join(cls)
+                            .where(cls.key == cls.make_key(name)))
+
+    @classmethod
+    def listing(cls, name):
+        """Returns the entries with any variation of the tag name, with only
+        the columns for listings.
+        """
+        return Entry.listing().where(cls.tagged(name))
+
 
 class EntryTag(Model):
     entry = ForeignKeyField(Entry)
@@ -80,9 +317,404 @@ class EntryTag(Model):
 
     class Meta:
         database = DATABASE
+        indexes = (
+            (("entry", "tag"), True),
+        )
+
+
+class EntryIndex(FTS5Model):
+    """Full-text index of entries.  Each row's rowid is its entry's id."""
+    rowid = RowIDField()
+    title = SearchField()
+    learned = SearchField()
+    resources = SearchField()
+
+    class Meta:
+        database = DATABASE
+        options = {"tokenize": "porter unicode61"}
+
+    @staticmethod
+    def quote(text):
+        """Turns search text into an FTS5 query matching all of its words.
+
+        Each word is quoted, so that user input can't use (or break) the query
+        syntax, and control characters (which FTS5 can't parse even in quotes)
+        separate words.  Returns an empty string if there are no words.
+        """
+        return " ".join('"{}"'.format(word.replace('"', '""'))
+                        for word in CONTROL_CHARACTERS.sub(" ", text).split())
+
+    @classmethod
+    def add(cls, entry):
+        """Adds the entry to the index, replacing it if it is already there."""
+        cls.replace(rowid=entry.id, title=entry.title, learned=entry.learned,
+                    resources=entry.resources).execute()
+
+    @classmethod
+    def remove(cls, entry):
+        """Removes the entry from the index."""
+        cls.delete().where(cls.rowid == entry.id).execute()
+
+    @classmethod
+    def rebuild(cls):
+        """Indexes every entry from scratch."""
+        with DATABASE.atomic():
+            cls.delete().execute()
+            cls.insert_from(
+                Entry.select(Entry.id, Entry.title, Entry.learned,
+                             Entry.resources),
+                fields=[cls.rowid, cls.title, cls.learned, cls.resources]
+            ).execute()
+
+    @classmethod
+    def search(cls, text):
+        """Returns a listing query for the entries matching the search text,
+        best matches (by bm25, weighting titles highest) first.
+
+        Each result has a snippet of its best matching text, with the matches
+        delimited by SNIPPET_START and SNIPPET_END.
+        """
+        return (Entry
+                .listing()
+                .select_extend(fn.snippet(
+                    cls._meta.entity, -1, SNIPPET_START, SNIPPET_END, "…",
+                    16).alias("snippet"))
+                .switch(Entry)
+                .join(cls, on=(cls.rowid == Entry.id))
+                .where(cls.match(cls.quote(text)))
+                .order_by(cls.bm25(10.0, 1.0, 1.0))
+                )
+
+
+# Control characters, which aren't allowed in search queries.
+CONTROL_CHARACTERS = re.compile("[\x00-\x1f\x7f]")
+# Snippet delimiters.  Control characters, which entries aren't expected to
+# contain; in one that does, they come out as stray highlights (the entry's
+# text is still escaped).
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+
+class Rollup(Model):
+    """Base for the statistics rollups, which hold the number of entries and
+    the minutes spent on them by month (yyyy-mm) and hidden flag.
+
+    They are kept up to date by removing each entry before it is changed and
+    adding it back after, in the same transaction (see add and remove), and
+    can be rebuilt from the entries.
+
+    Each subclass names the field it rolls up by (besides the month) in key,
+    and has a query of the rolled up entries, selecting only their keys, in
+    source.
+    """
+    month = CharField(max_length=7)
+    hidden = BooleanField()
+    entries = IntegerField(default=0)
+    minutes = IntegerField(default=0)
+    key = None
+    source = None
+
+    class Meta:
+        database = DATABASE
+
+    @classmethod
+    def change(cls, entries, sign: int) -> None:
+        """Adds the entries matching a condition (all of them, if it is None)
+        to the rollup, as they are in the database, or with sign -1, removes
+        them.
+        """
+        key = getattr(cls, cls.key)
+        source = cls.source
+        if entries is not None:
+            source = source.where(entries)
+        (cls.insert_from(
+            source.select_extend(MONTH, Entry.hidden, fn.COUNT(Entry.id) * sign,
+                                 fn.SUM(MINUTES) * sign)
+            .group_by(*cls.source.selected_columns, MONTH, Entry.hidden),
+            fields=[key, cls.month, cls.hidden, cls.entries, cls.minutes])
+         .on_conflict(
+            conflict_target=[key, cls.month, cls.hidden],
+            update={cls.entries: cls.entries + EXCLUDED.entries,
+                    cls.minutes: cls.minutes + EXCLUDED.minutes})
+         .execute())
+        if sign < 0:
+            (cls.delete()
+             .where((cls.entries <= 0) & key.in_(source))
+             .execute())
+
+    # Callers of add and remove must run them in the transaction which saves
+    # the entry.
+    @staticmethod
+    def add(entry) -> None:
+        """Adds the entry (and its tags) to every rollup."""
+        Rollup.add_matching(Entry.id == entry.id)
+
+    @staticmethod
+    def add_matching(entries) -> None:
+        """Adds the entries matching a condition to every rollup, with one
+        statement per rollup (as after a bulk import).
+        """
+        for rollup in ROLLUPS:
+            rollup.change(entries, 1)
+
+    @staticmethod
+    def remove(entry) -> None:
+        """Removes the entry (and its tags) from every rollup."""
+        for rollup in ROLLUPS:
+            rollup.change(Entry.id == entry.id, -1)
+
+    @classmethod
+    def totals(cls, *columns, hidden: bool):
+        """Returns a query of the totals of the rollup, grouped by the
+        columns.  Hidden entries are counted only if hidden is True.
+        """
+        query = (cls
+                 .select(*columns, fn.SUM(cls.entries).alias("entries"),
+                         fn.SUM(cls.minutes).alias("minutes"))
+                 .group_by(*columns))
+        if not hidden:
+            query = query.where(cls.hidden == False)  # noqa E712
+        return query
+
+    @staticmethod
+    def rebuild() -> None:
+        """Rolls up every entry from scratch."""
+        with DATABASE.atomic():
+            for rollup in ROLLUPS:
+                rollup.delete().execute()
+                rollup.change(None, 1)
+
+
+class UserMonth(HiddenMixin, Rollup):
+    """Entries and time spent, by author and month."""
+    user = ForeignKeyField(User, backref="months")
+    key = "user"
+    source = Entry.select(Entry.user)
+
+    class Meta:
+        primary_key = CompositeKey("user", "month", "hidden")
+
+
+class TagMonth(Rollup):
+    """Entries and time spent, by tag and month."""
+    tag = ForeignKeyField(Tag, backref="months")
+    key = "tag"
+    source = EntryTag.select(EntryTag.tag).join(Entry)
+
+    class Meta:
+        primary_key = CompositeKey("tag", "month", "hidden")
+
+
+ROLLUPS = [UserMonth, TagMonth]
+# An entry's month, and its time spent in minutes (times are stored as
+# hh:mm:ss).
+MONTH = fn.substr(Entry.date, 1, 7)
+MINUTES = (fn.substr(Entry.time_spent, 1, 2).cast("INTEGER") * 60 +
+           fn.substr(Entry.time_spent, 4, 2).cast("INTEGER"))
+
+
+class Related(Model):
+    """Each entry's most related entries:  the RELATED_COUNT others whose
+    tags overlap most with its own, by the Jaccard similarity of their sets
+    of tag keys (shared keys over all of their keys).
+
+    Tags on more than RELATED_MAX_TAG_ENTRIES entries are too common to relate
+    entries by (and would make refreshing an entry touch too many others).
+    refresh() recomputes an entry's list, and its place in the lists of the
+    entries it shares tags with, whenever its tags change.  An entry which
+    drops out of another's list leaves a gap there until the list is rebuilt,
+    so lists may hold a few less than they could.
+    """
+    entry = ForeignKeyField(Entry, backref="related")
+    related = ForeignKeyField(Entry)
+    score = FloatField()
+
+    class Meta:
+        database = DATABASE
+        primary_key = CompositeKey("entry", "related")
+
+    @classmethod
+    def refresh(cls, entry) -> None:
+        """Recomputes the entry's related entries, and its place in theirs.
+        Must be run in the transaction which changes the entry's tags.
+        """
+        (cls.delete()
+         .where((cls.entry == entry.id) | (cls.related == entry.id))
+         .execute())
+        fields = [cls.entry, cls.related, cls.score]
+        cls.insert_from(
+            cls.scores(entry)
+            .order_by(SQL("score").desc(), SQL("related"))
+            .limit(RELATED_COUNT),
+            fields=fields).execute()
+        cls.insert_from(cls.scores(entry, reverse=True), fields=fields).execute()
+        # Drop whatever the entry pushed out of the others' lists.
+        ranked = cls.ranked(cls.entry.in_(
+            cls.select(cls.entry).where(cls.related == entry.id)))
+        (cls.delete()
+         .where(Tuple(cls.entry, cls.related).in_(
+            Select([ranked], [ranked.c.entry, ranked.c.related])
+            .where(ranked.c.rank > RELATED_COUNT)))
+         .execute())
+
+    @staticmethod
+    def rebuild() -> None:
+        """Recomputes every entry's related entries.
+
+        (Each entry's tag keys are counted once here, rather than once for
+        each of its pairs as in scores().)
+        """
+        sizes = (EntryTag
+                 .select(EntryTag.entry.alias("entry"),
+                         fn.COUNT(Tag.key.distinct()).alias("keys"))
+                 .join(Tag)
+                 .group_by(EntryTag.entry))
+        own_sizes = sizes.cte("own_sizes")
+        other_sizes = sizes.clone().cte("other_sizes")
+        pairs = Related.pairs().alias("pairs")
+        score = pairs.c.shared * 1.0 / (
+            own_sizes.c.keys + other_sizes.c.keys - pairs.c.shared)
+        ranked = (Select([pairs], [
+                      pairs.c.entry, pairs.c.related, score.alias("score"),
+                      fn.ROW_NUMBER().over(
+                          partition_by=[pairs.c.entry],
+                          order_by=[score.desc(), pairs.c.related]
+                      ).alias("rank")])
+                  .join(own_sizes, on=(own_sizes.c.entry == pairs.c.entry))
+                  .join(other_sizes,
+                        on=(other_sizes.c.entry == pairs.c.related))
+                  .with_cte(own_sizes, other_sizes)
+                  .alias("ranked"))
+        with DATABASE.atomic():
+            Related.delete().execute()
+            Related.insert_from(
+                Select([ranked], [ranked.c.entry, ranked.c.related,
+                                  ranked.c.score])
+                .where(ranked.c.rank <= RELATED_COUNT),
+                fields=[Related.entry, Related.related, Related.score]
+            ).execute()
+
+    @classmethod
+    def ranked(cls, lists):
+        """Returns a subquery of the rows of the lists matching the condition,
+        with their rank in their list (from 1, most related first).
+        """
+        return (cls
+                .select(cls.entry.alias("entry"), cls.related.alias("related"),
+                        fn.ROW_NUMBER().over(
+                            partition_by=[cls.entry],
+                            order_by=[cls.score.desc(), cls.related])
+                        .alias("rank"))
+                .where(lists)
+                .alias("ranked"))
+
+    @staticmethod
+    def pairs(entry=None):
+        """Returns a query of (entry, related, shared) for the entry (or every
+        entry) and each other entry it shares tags with, and the number of
+        tag keys they share (not counting those too common to relate
+        entries).
+        """
+        Own = EntryTag.alias()
+        Other = EntryTag.alias()
+        OwnTag = Tag.alias()
+        OtherTag = Tag.alias()
+        common = (Tag
+                  .select(Tag.key)
+                  .join(TagMonth)
+                  .group_by(Tag.key)
+                  .having(fn.SUM(TagMonth.entries) > RELATED_MAX_TAG_ENTRIES))
+        if entry is not None:
+            # Only the entry's own tags need checking.
+            common = common.where(Tag.key.in_(
+                Tag.select(Tag.key).join(EntryTag)
+                .where(EntryTag.entry == entry.id)))
+        query = (Own
+                 .select(Own.entry.alias("entry"), Other.entry.alias("related"),
+                         fn.COUNT(OwnTag.key.distinct()).alias("shared"))
+                 .join(OwnTag, on=(Own.tag == OwnTag.id))
+                 .join(OtherTag, on=(OtherTag.key == OwnTag.key))
+                 .join(Other, on=(Other.tag == OtherTag.id))
+                 .where((Other.entry != Own.entry) &
+                        OwnTag.key.not_in(common))
+                 .group_by(Own.entry, Other.entry))
+        if entry is not None:
+            query = query.where(Own.entry == entry.id)
+        return query
+
+    @staticmethod
+    def scores(entry, reverse: bool = False):
+        """Returns a query of (entry, related, score) for the entry and each
+        other entry it shares tags with.  With reverse, the other entry comes
+        first.
+        """
+        pairs = Related.pairs(entry).alias("pairs")
+        score = pairs.c.shared * 1.0 / (
+            tag_count(pairs.c.entry) + tag_count(pairs.c.related) -
+            pairs.c.shared)
+        pair = [pairs.c.entry, pairs.c.related]
+        if reverse:
+            pair.reverse()
+        return Select([pairs], [pair[0].alias("entry"),
+                                pair[1].alias("related"),
+                                score.alias("score")])
+
+    @classmethod
+    def listing(cls, entry):
+        """Returns a query for the listings of the entry's related entries,
+        most related first (with when they were modified).
+        """
+        return (Entry.listing()
+                .select_extend(Entry.modified)
+                .join_from(Entry, cls, on=(cls.related == Entry.id))
+                .where(cls.entry == entry.id)
+                .order_by(cls.score.desc(), cls.related))
+
+
+def tag_count(entry):
+    """Returns the number of tag keys of an entry (column), as a subquery.
+
+    (Wrapped in a function call, since adding bare subqueries together would
+    make a compound query.)
+    """
+    Links = EntryTag.alias()
+    Tags = Tag.alias()
+    return fn.COALESCE(Links
+                       .select(fn.COUNT(Tags.key.distinct()))
+                       .join(Tags, on=(Links.tag == Tags.id))
+                       .where(Links.entry == entry), 0)
 
 
 def initialize():
     DATABASE.connect()
+    migrate_tables()
     DATABASE.create_tables([User, Entry, Tag, EntryTag], safe=True)
+    # Build the full-text index and the rollups when they are first created.
+    if not EntryIndex.table_exists():
+        EntryIndex.create_table()
+        EntryIndex.rebuild()
+    if not UserMonth.table_exists():
+        DATABASE.create_tables(ROLLUPS)
+        Rollup.rebuild()
+    if not Related.table_exists():
+        Related.create_table()
+        Related.rebuild()
     DATABASE.close()
+
+
+def migrate_tables():
+    """Adds columns missing from databases created by earlier versions."""
+    migrator = SqliteMigrator(DATABASE)
+    if (Tag.table_exists() and "key" not in
+            [column.name for column in DATABASE.get_columns("tag")]):
+        with DATABASE.atomic():
+            migrate(migrator.add_column(
+                "tag", "key", CharField(max_length=256, default="")))
+            for tag in Tag.select(Tag.id, Tag.name):
+                tag.save(only=[Tag.key])
+    # Existing entries are treated as modified at the time of the migration.
+    if (Entry.table_exists() and "modified" not in
+            [column.name for column in DATABASE.get_columns("entry")]):
+        with DATABASE.atomic():
+            migrate(migrator.add_column(
+                "entry", "modified", DateTimeField(default=utcnow)))
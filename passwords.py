@@ -0,0 +1,66 @@
+"""Password hashing module for the Learning Journal app.
+
+bcrypt is deliberately slow, so hashing and checking passwords run in a small
+pool of worker threads rather than on the request threads.  At most
+HASH_WORKERS passwords are hashed at once, and at most HASH_QUEUE more may wait
+their turn; beyond that, requests are turned away (with Busy) instead of piling
+up behind each other.
+"""
+
+from concurrent import futures
+import os
+import threading
+
+from flask_bcrypt import check_password_hash, generate_password_hash
+
+# bcrypt's cost (each step doubles the time a hash takes), the threads which
+# hash, how many more passwords may wait for them, and how many seconds a
+# caller waits for its password before giving up with Busy.
+BCRYPT_ROUNDS = int(os.environ.get("JOURNAL_BCRYPT_ROUNDS", 12))
+HASH_WORKERS = int(os.environ.get("JOURNAL_HASH_WORKERS", os.cpu_count() or 2))
+HASH_QUEUE = int(os.environ.get("JOURNAL_HASH_QUEUE", 4 * HASH_WORKERS))
+HASH_TIMEOUT = float(os.environ.get("JOURNAL_HASH_TIMEOUT", 10))
+
+_executor = futures.ThreadPoolExecutor(max_workers=HASH_WORKERS,
+                                       thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+
+class Busy(Exception):
+    """Raised when too many passwords are already waiting to be hashed."""
+
+
+def _run(function, *args):
+    """Runs the function in the hashing pool, and returns its result."""
+    if not _slots.acquire(blocking=False):
+        raise Busy
+    try:
+        future = _executor.submit(function, *args)
+    except RuntimeError:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except futures.TimeoutError:
+        raise Busy
+
+
+def hash_password(password: str) -> str:
+    """Returns the bcrypt hash of the password, at the configured cost."""
+    return _run(generate_password_hash, password, BCRYPT_ROUNDS).decode()
+
+
+def check_password(password_hash: str, password: str) -> bool:
+    """Returns True if the password matches the hash."""
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Returns True if the hash was made at a cost other than the configured
+    one.  (bcrypt hashes look like "$2b$<cost>$<salt and hash>".)
+    """
+    try:
+        return int(password_hash.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,173 @@
+"""Slow query log for the Learning Journal app.
+
+Every SQL statement that takes longer than SLOW_QUERY_MS to execute is logged,
+with its parameters, the route that ran it and SQLite's query plan for it, as
+one JSON object per line of a rotating log file.  Run this module to summarize
+the log, with the statements grouped by shape (their SQL with literals and
+lists of parameters collapsed), slowest total first:
+
+    python slow_queries.py [--log slow_queries.log] [--top 20]
+"""
+
+import argparse
+import collections
+import datetime
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import re
+import time
+
+from flask import has_request_context, request
+
+# Statements slower than SLOW_QUERY_MS milliseconds are logged (0 turns the
+# log off) to LOG_FILE, which is rotated at LOG_BYTES, keeping LOG_BACKUPS old
+# logs.
+SLOW_QUERY_MS = float(os.environ.get("JOURNAL_SLOW_QUERY_MS", 100))
+LOG_FILE = os.environ.get("JOURNAL_SLOW_QUERY_LOG", "slow_queries.log")
+LOG_BYTES = int(os.environ.get("JOURNAL_SLOW_QUERY_LOG_BYTES", 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get("JOURNAL_SLOW_QUERY_LOG_BACKUPS", 5))
+
+# Only these statements have query plans.
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+# Rules for reducing a statement to its shape, applied in order.
+SHAPE_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r'SAVEPOINT "\w+"'), "SAVEPOINT ?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+"), "(...), ..."),
+    (re.compile(r"\s+"), " "),
+]
+
+logger = logging.getLogger("journal.slow_queries")
+logger.propagate = False
+
+
+def install(database) -> None:
+    """Logs the database's slow statements (unless the log is turned off)."""
+    if SLOW_QUERY_MS <= 0:
+        return
+    if not logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+            encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    execute_sql = database.execute_sql
+
+    def logged_execute_sql(sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        cursor = execute_sql(sql, params, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            log(database, sql, params, elapsed)
+        return cursor
+
+    database.execute_sql = logged_execute_sql
+
+
+def log(database, sql: str, params, elapsed: float) -> None:
+    """Logs a slow statement."""
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "ms": round(elapsed * 1000, 1),
+        "route": request.endpoint if has_request_context() else None,
+        "path": request.full_path if has_request_context() else None,
+        "sql": sql,
+        "params": list(params or ()),
+        "plan": explain(database, sql, params),
+    }
+    logger.info(json.dumps(record, default=str))
+
+
+def explain(database, sql: str, params) -> list:
+    """Returns SQLite's query plan for a statement, as indented lines (or
+    None if it has none).
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    try:
+        rows = database.connection().execute(
+            "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    except Exception:  # The plan is only a nice-to-have.
+        return None
+    depths = {}
+    lines = []
+    for node, parent, _, detail in rows:
+        depths[node] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node] + detail)
+    return lines
+
+
+def shape(sql: str) -> str:
+    """Returns the shape of a statement."""
+    for pattern, replacement in SHAPE_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def read_log(path: str):
+    """Yields the records in the log and its backups, oldest first."""
+    numbers = sorted((int(name.rsplit(".", 1)[1])
+                      for name in glob.glob(glob.escape(path) + ".*")
+                      if name.rsplit(".", 1)[1].isdigit()), reverse=True)
+    for name in [f"{path}.{number}" for number in numbers] + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def report(path: str, top: int) -> None:
+    """Prints the statement shapes in the log, slowest total first."""
+    shapes = collections.defaultdict(
+        lambda: {"count": 0, "total": 0.0, "max": 0.0,
+                 "routes": collections.Counter(), "plan": None})
+    for record in read_log(path):
+        summary = shapes[shape(record["sql"])]
+        summary["count"] += 1
+        summary["total"] += record["ms"]
+        summary["max"] = max(summary["max"], record["ms"])
+        summary["routes"][record.get("route") or "-"] += 1
+        # Keep the latest plan, since indexes may have changed since.
+        summary["plan"] = record.get("plan") or summary["plan"]
+    if not shapes:
+        print(f"No slow statements in {path}.")
+        return
+    ranked = sorted(shapes.items(), key=lambda item: item[1]["total"],
+                    reverse=True)
+    for statement, summary in ranked[:top]:
+        print(f"{summary['count']} times, {summary['total']:.1f}ms total, "
+              f"{summary['total'] / summary['count']:.1f}ms mean, "
+              f"{summary['max']:.1f}ms max")
+        print("  routes: " + ", ".join(
+            f"{route} ({count})"
+            for route, count in summary["routes"].most_common()))
+        print(f"  {statement}")
+        for line in summary["plan"] or []:
+            print(f"    {line}")
+        print()
+    if len(ranked) > top:
+        print(f"({len(ranked) - top} more shapes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the slow query log.")
+    parser.add_argument("--log", default=LOG_FILE, help="log file")
+    parser.add_argument("--top", type=int, default=20,
+                        help="number of statement shapes to show")
+    args = parser.parse_args()
+    report(args.log, args.top)
+
+
+if __name__ == "__main__":
+    main()
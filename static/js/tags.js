@@ -0,0 +1,43 @@
+/* Tag autocompletion for the entry form.
+
+   Suggests tags for the last (comma-separated) tag being typed into the Tags
+   field, from the app's tag index, as options of the field's datalist.  Each
+   option is the whole field value with the last tag completed, so picking one
+   keeps the tags before it. */
+(function () {
+    "use strict";
+    var script = document.currentScript;
+    var url = script.getAttribute("data-url");
+    var field = document.getElementById("tags");
+    var list = document.getElementById("tag-suggestions");
+    var latest = 0;
+    if (!field || !list) {
+        return;
+    }
+    field.addEventListener("input", function () {
+        var value = field.value;
+        var comma = value.lastIndexOf(",");
+        var before = comma < 0 ? "" : value.slice(0, comma + 1) + " ";
+        var prefix = value.slice(comma + 1).trim();
+        var request = ++latest;
+        if (!prefix) {
+            list.innerHTML = "";
+            return;
+        }
+        fetch(url + "?q=" + encodeURIComponent(prefix), {credentials: "omit"})
+            .then(function (response) { return response.json(); })
+            .then(function (body) {
+                // Ignore answers to older keystrokes.
+                if (request !== latest) {
+                    return;
+                }
+                list.innerHTML = "";
+                body.data.forEach(function (tag) {
+                    var option = document.createElement("option");
+                    option.value = before + tag.name;
+                    option.label = tag.name + " (" + tag.count + ")";
+                    list.appendChild(option);
+                });
+            });
+    });
+}());
@@ -0,0 +1,76 @@
+"""Statistics module for the Learning Journal app.
+
+The /stats page shows the number of entries and the time spent on them by
+month, by author and by tag.  It reads them from the rollup tables (see
+models.Rollup), which the app keeps up to date in the same transactions as the
+entries, so the page costs a few small grouped queries however many entries
+there are.  Rebuild the rollups from the entries (after changing the database
+by other means) with:
+
+    python stats.py --rebuild
+"""
+
+import argparse
+import os
+
+import models
+
+# Months shown on the statistics page, and the most authors and tags shown
+# (JOURNAL_STATS_MONTHS and JOURNAL_STATS_TOP).
+MONTHS = int(os.environ.get("JOURNAL_STATS_MONTHS", "24"))
+TOP = int(os.environ.get("JOURNAL_STATS_TOP", "20"))
+
+
+def summary(hidden: bool) -> dict:
+    """Returns the statistics for the page:  totals, by month (latest first),
+    author and tag (most entries first).  Hidden entries are counted only if
+    hidden is True.
+    """
+    months = list(models.UserMonth.totals(models.UserMonth.month,
+                                          hidden=hidden)
+                  .order_by(models.UserMonth.month.desc())
+                  .dicts())
+    users = list(models.UserMonth.totals(models.User.username, hidden=hidden)
+                 .join(models.User)
+                 .order_by(models.SQL("entries").desc(),
+                           models.User.username)
+                 .limit(TOP)
+                 .dicts())
+    # Tags which differ only in case are counted together.
+    tags = list(models.TagMonth.totals(models.Tag.key, hidden=hidden)
+                .select_extend(models.fn.MIN(models.Tag.name).alias("name"))
+                .join(models.Tag)
+                .order_by(models.SQL("entries").desc(), models.Tag.key)
+                .limit(TOP)
+                .dicts())
+    return {
+        "entries": sum(month["entries"] for month in months),
+        "minutes": sum(month["minutes"] for month in months),
+        "months": months[:MONTHS],
+        "users": users,
+        "tags": tags,
+    }
+
+
+def duration(minutes: int) -> str:
+    """Formats a number of minutes as hours and minutes (h:mm)."""
+    return f"{minutes // 60:,}:{minutes % 60:02}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintain the statistics rollups.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the rollups from the entries")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do (use --rebuild)")
+    models.initialize()
+    with models.DATABASE.connection_context():
+        models.Rollup.rebuild()
+    # Cached pages may show the old statistics.
+    models.data_version.bump()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Data shared by the tests of the Learning Journal app."""
+
+# Logins for the roles the routes are tested as.
+USERS = {
+    "anonymous": None,
+    "author": ("tip_of_the_day", "inspire"),
+    "god": ("god", "iamgod"),
+}
+# Entry form data, for creating and editing entries.
+ENTRY = {
+    "title": "Budgets",
+    "date": "2020-11-01",
+    "time_spent": "0:30",
+    "learned": "Count the queries.",
+    "resources": "",
+    "tags": "inspire, progress",
+}
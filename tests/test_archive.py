@@ -0,0 +1,45 @@
+"""Tests of the year and month archives of the Learning Journal app."""
+
+from tests.data import USERS
+
+
+def test_periods_select_entries_by_date(clients):
+    client = clients["anonymous"]
+    for url in ["/entries/tip_of_the_day/2020", "/archive/2020/10"]:
+        page = client.get(url).get_data(as_text=True)
+        assert "Progress" in page
+    for url in ["/entries/tip_of_the_day/2020/9", "/archive/2019",
+                "/archive/2020/11"]:
+        page = client.get(url).get_data(as_text=True)
+        assert "Progress" not in page
+
+
+def test_no_such_month(clients):
+    for url in ["/entries/tip_of_the_day/2020/13", "/archive/2020/0",
+                "/archive/0"]:
+        response = clients["anonymous"].get(url)
+        assert response.status_code == 302
+
+
+def test_hidden_entries_archived_for_god(clients):
+    """Hidden entries are listed, and counted in the archive links, only for
+    those who may see them.
+    """
+    for role in USERS:
+        client = clients[role]
+        for url in ["/archive/5454/10", "/entries/prez_skroob/5454"]:
+            page = client.get(url).get_data(as_text=True)
+            assert ("Plans for the Future" in page) == (role == "god")
+        page = client.get("/archive").get_data(as_text=True)
+        assert ('href="/archive/5454/10"' in page) == (role == "god")
+
+
+def test_archive_counts_match_entries(journal, clients):
+    page = clients["god"].get("/entries/tip_of_the_day").get_data(
+        as_text=True)
+    with journal.models.DATABASE.connection_context():
+        count = (journal.models.Entry.select().join(journal.models.User)
+                 .where(journal.models.User.username == "tip_of_the_day",
+                        journal.models.Entry.date.startswith("2020-10"))
+                 .count())
+    assert f'href="/entries/tip_of_the_day/2020/10">Oct</a> ({count})' in page
@@ -0,0 +1,14 @@
+"""Tests of the cache module of the Learning Journal app."""
+
+import cache
+
+
+def test_data_versions_never_repeat(tmp_path):
+    version = cache.DataVersion(str(tmp_path / "version"))
+    assert version.value is None
+    seen = {version.value}
+    for _ in range(1000):
+        old, new = version.bump()
+        assert old in seen and new not in seen
+        assert version.value == new
+        seen.add(new)
@@ -0,0 +1,24 @@
+"""Tests of the conditional GETs of the Learning Journal app."""
+
+from tests.data import ENTRY
+
+
+def test_listing_changes_when_entry_deleted(journal, clients):
+    response = clients["author"].post("/entries/new", data=dict(
+        ENTRY, title="Conditional"))
+    assert response.status_code == 302
+    with journal.models.DATABASE.connection_context():
+        entry_id = journal.models.Entry.get(
+            journal.models.Entry.title == "Conditional").id
+    client = clients["anonymous"]
+    response = client.get("/")
+    assert "Conditional" in response.get_data(as_text=True)
+    etag = response.headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    response = clients["author"].post(f"/entries/{entry_id}/delete")
+    assert response.status_code == 302
+    for headers in [{"If-None-Match": etag},
+                    {"If-Modified-Since": "Fri, 01 Jan 9999 00:00:00 GMT"}]:
+        response = client.get("/", headers=headers)
+        assert response.status_code == 200
+        assert "Conditional" not in response.get_data(as_text=True)
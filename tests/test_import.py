@@ -0,0 +1,72 @@
+"""Tests of the bulk import tool of the Learning Journal app."""
+
+import io
+
+import pytest
+
+import bulk_import
+import export
+
+FIELDS = ["title", "date", "time_spent", "learned", "resources", "tags",
+          "private", "hidden"]
+
+
+@pytest.fixture
+def importer(journal, tmp_path):
+    """An importer, with a user (imported) for the entries it imports, who is
+    removed with their entries after the test.
+    """
+    models = journal.models
+    users = tmp_path / "users.jsonl"
+    users.write_text('{"username": "imported", "password": "imported"}\n')
+    with models.DATABASE.connection_context():
+        models.DATABASE.create_tables([bulk_import.ImportProgress], safe=True)
+        importer = bulk_import.Importer(out=io.StringIO())
+        importer.run(str(users), "users")
+    yield importer
+    with models.DATABASE.connection_context():
+        user = models.User.get(models.User.username == "imported")
+        tag_changes = []
+        for entry in models.Entry.select().where(models.Entry.user == user):
+            tag_changes.extend(journal.write(journal.remove_entry, entry))
+        user.delete_instance()
+    journal.bump_data_version(tag_changes)
+
+
+def exported(username: str) -> list:
+    return [{field: row[field] for field in FIELDS}
+            for row in export.entries(username)]
+
+
+@pytest.mark.parametrize("export_format", ["jsonl", "csv"])
+def test_export_round_trip(journal, importer, tmp_path, export_format):
+    """Entries exported from one user and imported for another are the
+    same (times spent included, which are exported as hh:mm:ss).
+    """
+    path = tmp_path / f"entries.{export_format}"
+    with journal.models.DATABASE.connection_context():
+        rows = [dict(row, username="imported")
+                for row in export.entries("tip_of_the_day")]
+        path.write_text("".join(export.stream(rows, export_format)),
+                        encoding="utf-8")
+        assert importer.run(str(path), "entries") == len(rows)
+        assert importer.rejected == 0
+        assert exported("imported") == exported("tip_of_the_day")
+
+
+def test_restart_skips_imported_entries(journal, importer, tmp_path):
+    path = tmp_path / "entries.jsonl"
+    with journal.models.DATABASE.connection_context():
+        rows = [dict(row, username="imported")
+                for row in export.entries("tip_of_the_day")]
+        path.write_text("".join(export.jsonl(rows)), encoding="utf-8")
+        assert importer.run(str(path), "entries") == len(rows)
+        assert importer.run(str(path), "entries", restart=True) == 0
+        assert len(exported("imported")) == len(rows)
+
+
+def test_short_and_long_times_spent():
+    assert str(bulk_import.to_time("1:30")) == "01:30:00"
+    assert str(bulk_import.to_time("01:30:15")) == "01:30:15"
+    with pytest.raises(ValueError):
+        bulk_import.to_time("90 minutes")
@@ -0,0 +1,191 @@
+"""Query budgets for every route of the Learning Journal app.
+
+Each route is requested as a visitor who isn't logged in, as an author and as
+god, and must run no more than its budget of SQL statements, however many
+entries or tags it shows.  (A route which runs a query per entry or per tag
+fails the growth tests, even if it fits its budget with the fixtures.)
+"""
+
+import pytest
+
+from tests.data import ENTRY, USERS
+
+
+# Routes, and the most statements a request may run.  URLs are filled in from
+# the entries fixture.
+READS = [
+    ("/", 2),
+    ("/?after=2020-01-01,99999999999999999999999", 2),
+    ("/entries", 0),
+    ("/entries/tip_of_the_day", 4),
+    ("/entries/nobody", 3),
+    ("/entries/tip_of_the_day/2020", 4),
+    ("/entries/tip_of_the_day/2020/10", 4),
+    ("/entries/tip_of_the_day/2020/13", 1),
+    ("/archive", 2),
+    ("/archive/2020", 3),
+    ("/archive/2020/10", 3),
+    ("/archive/0", 1),
+    ("/entries/tip_of_the_day/export", 2),
+    ("/entries/tip_of_the_day/export?format=csv", 2),
+    ("/entries/tip_of_the_day/export?format=markdown", 2),
+    ("/export", 2),
+    ("/entries/{public}", 4),
+    ("/entries/{private}", 4),
+    ("/entries/{hidden}", 4),
+    ("/entries/0", 1),
+    ("/entries/new", 1),
+    ("/entries/{public}/edit", 3),
+    ("/tags/inspire", 3),
+    ("/tags/Air%20Supply", 3),
+    ("/tags/nothing", 2),
+    ("/tags", 2),
+    ("/autocomplete/tags?q=air", 1),
+    ("/search?q=air", 2),
+    ("/search?q=a%00b", 2),
+    ("/search?q=%00", 1),
+    ("/search", 1),
+    ("/register", 1),
+    ("/login", 1),
+    ("/metrics", 0),
+    ("/stats", 4),
+    ("/api/entries", 2),
+    ("/api/entries?after=2020-01-01,99999999999999999999999", 2),
+    ("/api/entries?fields=id,title,learned,username,tags", 2),
+    ("/api/users/tip_of_the_day/entries", 2),
+    ("/api/tags/inspire/entries", 2),
+    ("/api/entries/{public}", 2),
+    ("/api/entries/{private}", 2),
+    ("/api/entries/99999999999999999999", 0),
+    ("/api/entries/nothing", 0),
+    ("/api/users", 1),
+    ("/api/users?after=99999999999999999999999", 1),
+    ("/api/tags", 2),
+]
+# Writes (made by the author and god), and their budgets.
+CREATE = 14
+EDIT = 22
+DELETE = 18
+# Routes which list entries or tags, for the growth tests.
+LISTINGS = [
+    "/",
+    "/?after=2020-10-26,1",
+    "/entries/tip_of_the_day",
+    "/entries/tip_of_the_day/export",
+    "/entries/tip_of_the_day/2020",
+    "/archive",
+    "/archive/2020/10",
+    "/export",
+    "/tags/inspire",
+    "/search?q=progress",
+    "/stats",
+    "/tags",
+    "/autocomplete/tags?q=progress",
+    "/api/entries",
+    "/api/entries?fields=id,title,learned,username,tags",
+    "/api/users/tip_of_the_day/entries",
+    "/api/tags/inspire/entries",
+    "/api/tags",
+]
+
+
+@pytest.fixture(scope="module")
+def entries(journal):
+    """Ids of the fixture entries, by kind."""
+    titles = {"public": "Progress", "private": "So Much for the Garden Idea",
+              "hidden": "Plans for the Future"}
+    with journal.models.DATABASE.connection_context():
+        return {kind: journal.models.Entry.get(
+                    journal.models.Entry.title == title).id
+                for kind, title in titles.items()}
+
+
+@pytest.mark.parametrize("role", USERS)
+@pytest.mark.parametrize("url, budget", READS)
+def test_read_budget(clients, count_queries, entries, role, url, budget):
+    client = clients[role]
+    response, queries = count_queries(
+        lambda: client.get(url.format(**entries)))
+    # (Some are errors, like the API's 403 and 404 responses.)
+    assert response.status_code < 500
+    assert queries <= budget
+
+
+@pytest.mark.parametrize("role", USERS)
+def test_write_budget(journal, clients, count_queries, role):
+    client = clients[role]
+    response, queries = count_queries(
+        lambda: client.post("/entries/new", data=ENTRY))
+    assert response.status_code == 302
+    assert queries <= CREATE
+    if role == "anonymous":
+        return
+    with journal.models.DATABASE.connection_context():
+        entry_id = journal.models.Entry.get(
+            journal.models.Entry.title == ENTRY["title"]).id
+    response, queries = count_queries(lambda: client.post(
+        f"/entries/{entry_id}/edit", data=dict(ENTRY, tags="success")))
+    assert response.status_code == 302
+    assert queries <= EDIT
+    response, queries = count_queries(
+        lambda: client.post(f"/entries/{entry_id}/delete"))
+    assert response.status_code == 302
+    assert queries <= DELETE
+
+
+@pytest.mark.parametrize("role", ["author", "god"])
+def test_tag_writes_do_not_grow(journal, clients, count_queries, role):
+    """Saving an entry takes as many statements for many tags as for one."""
+    client = clients[role]
+    counts = []
+    for tags in ["one", ", ".join(f"tag {number}" for number in range(30))]:
+        response, queries = count_queries(lambda: client.post(
+            "/entries/new", data=dict(ENTRY, title=f"{role} tags",
+                                      tags=tags)))
+        assert response.status_code == 302
+        counts.append(queries)
+        with journal.models.DATABASE.connection_context():
+            entry_id = journal.models.Entry.get(
+                journal.models.Entry.title == f"{role} tags").id
+        response, queries = count_queries(lambda: client.post(
+            f"/entries/{entry_id}/edit", data=dict(ENTRY, tags="")))
+        counts.append(queries)
+        response, queries = count_queries(
+            lambda: client.post(f"/entries/{entry_id}/delete"))
+        counts.append(queries)
+    assert counts[:3] == counts[3:]
+
+
+def test_listings_do_not_grow(journal, clients, count_queries):
+    """Listings take as many statements for many entries as for a few."""
+    before = {(role, url): count_queries(lambda: clients[role].get(url))[1]
+              for role in USERS for url in LISTINGS}
+    add_entries(journal, 3 * journal.PAGE_SIZE)
+    after = {(role, url): count_queries(lambda: clients[role].get(url))[1]
+             for role in USERS for url in LISTINGS}
+    assert after == before
+
+
+def add_entries(journal, count: int) -> None:
+    """Adds entries (by the author and others, private, hidden and tagged) to
+    the database.
+    """
+    models = journal.models
+    with models.DATABASE.connection_context():
+        users = list(models.User.select())
+        with models.DATABASE.atomic():
+            for number in range(count):
+                entry = models.Entry.create(
+                    user=users[number % len(users)],
+                    title=f"Progress report {number}",
+                    date=f"2020-{number % 12 + 1:02}-{number % 28 + 1:02}",
+                    time_spent="1:00",
+                    learned="More progress.",
+                    resources="",
+                    tags=f"inspire, progress, report {number}",
+                    private=number % 3 == 0,
+                    hidden=number % 5 == 0)
+                journal.update_tags(entry, entry.tags)
+                models.EntryIndex.add(entry)
+                models.Rollup.add(entry)
+    journal.data_version.bump()
@@ -0,0 +1,48 @@
+"""Tests of the related entries of the Learning Journal app."""
+
+from tests.data import ENTRY
+
+
+def related_rows(models) -> list:
+    with models.DATABASE.connection_context():
+        return sorted(models.Related.select().tuples())
+
+
+def test_related_kept_current(journal, clients):
+    """Related entries kept up to date by the routes are among those rebuilt
+    from the tags (other entries' lists may have gaps), and the changed
+    entry's own list is exact.
+    """
+    models = journal.models
+    client = clients["author"]
+    response = client.post("/entries/new", data=dict(
+        ENTRY, title="Related", tags="Air Supply, inspire"))
+    assert response.status_code == 302
+    with models.DATABASE.connection_context():
+        entry_id = models.Entry.get(models.Entry.title == "Related").id
+    response = client.post(f"/entries/{entry_id}/edit", data=dict(
+        ENTRY, title="Related", tags="air supply, dark helmet, Druidia"))
+    assert response.status_code == 302
+    maintained = related_rows(models)
+    assert entry_id in {row[0] for row in maintained}
+    with models.DATABASE.connection_context():
+        models.Related.rebuild()
+    rebuilt = related_rows(models)
+    assert set(maintained) <= set(rebuilt)
+    assert ([row for row in maintained if row[0] == entry_id] ==
+            [row for row in rebuilt if row[0] == entry_id])
+    response = client.post(f"/entries/{entry_id}/delete")
+    assert response.status_code == 302
+    assert not [row for row in related_rows(models) if entry_id in row[:2]]
+
+
+def test_related_visibility(journal, clients):
+    """Hidden entries are listed as related only to those who can see them."""
+    with journal.models.DATABASE.connection_context():
+        entry_id = journal.models.Entry.get(
+            journal.models.Entry.title == "Planet of the Apes").id
+    pages = {role: clients[role].get(f"/entries/{entry_id}")
+             .get_data(as_text=True) for role in ["anonymous", "god"]}
+    assert "Related entries" in pages["anonymous"]
+    assert "Plans for the Future" not in pages["anonymous"]
+    assert "Plans for the Future" in pages["god"]
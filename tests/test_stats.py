@@ -0,0 +1,52 @@
+"""Tests of the statistics rollups of the Learning Journal app."""
+
+from tests.data import ENTRY, USERS
+
+
+def rollups(models) -> list:
+    """Returns the rows of every rollup."""
+    with models.DATABASE.connection_context():
+        return [sorted(rollup.select().tuples()) for rollup in models.ROLLUPS]
+
+
+def test_rollups_match_rebuild(journal, clients):
+    """Rollups kept up to date by the routes match rollups rebuilt from the
+    entries.
+    """
+    models = journal.models
+    client = clients["author"]
+    for number, tags in enumerate(["inspire, progress", "Inspire, stats"]):
+        response = client.post("/entries/new", data=dict(
+            ENTRY, title=f"Stats {number}", tags=tags))
+        assert response.status_code == 302
+    with models.DATABASE.connection_context():
+        first, second = [entry.id for entry in models.Entry.select().where(
+            models.Entry.title.startswith("Stats ")).order_by(models.Entry.id)]
+    # Moved to another month, hidden and retagged.
+    response = client.post(f"/entries/{first}/edit", data=dict(
+        ENTRY, date="2019-06-30", time_spent="2:45", hidden="y",
+        tags="progress, success"))
+    assert response.status_code == 302
+    response = client.post(f"/entries/{second}/delete")
+    assert response.status_code == 302
+    maintained = rollups(models)
+    with models.DATABASE.connection_context():
+        models.Rollup.rebuild()
+    assert rollups(models) == maintained
+    # No rows are left for months without entries.
+    with models.DATABASE.connection_context():
+        assert not models.TagMonth.select().where(
+            models.TagMonth.entries <= 0).exists()
+
+
+def test_hidden_entries_counted_for_god(journal, clients):
+    counts = {}
+    for role in USERS:
+        response = clients[role].get("/stats")
+        assert response.status_code == 200
+        counts[role] = journal.stats.summary(hidden=role == "god")["entries"]
+    with journal.models.DATABASE.connection_context():
+        entries = journal.models.Entry.select()
+        assert counts["god"] == entries.count()
+        assert counts["anonymous"] == counts["author"] == entries.where(
+            journal.models.Entry.hidden == False).count()  # noqa E712
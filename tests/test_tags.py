@@ -0,0 +1,88 @@
+"""Tests of the tag cloud and tag autocompletion of the Learning Journal app."""
+
+import pytest
+
+import cache
+from tests.data import ENTRY, USERS
+
+
+def test_prefix_index():
+    index = cache.PrefixIndex()
+    index.load([("Air Supply", 1), ("air supply", 2), ("airplanes", 1),
+                ("art", 4), ("unused", 0)])
+    assert index.complete("AIR", 10) == [("air supply", 3), ("airplanes", 1)]
+    assert index.complete("b", 10) == []
+    assert index.top(2) == [("art", 4), ("air supply", 3)]
+    index.change("Air Supply", 3)
+    index.change("art", -4)
+    index.change("bicycles", 1)
+    assert index.complete("a", 10) == [("Air Supply", 6), ("airplanes", 1)]
+    assert index.top(10) == [("Air Supply", 6), ("airplanes", 1),
+                             ("bicycles", 1)]
+    assert len(index) == 3
+    # (There is no character after the last one.)
+    assert index.complete("\U0010ffff", 10) == []
+    index.change("\U0010ffff", 1)
+    assert index.complete("\U0010ffff", 10) == [("\U0010ffff", 1)]
+
+
+def test_completion_runs_no_queries(journal, clients, query_counter):
+    for role in USERS:
+        clients[role].get("/autocomplete/tags?q=air")
+        start = query_counter.count
+        response = clients[role].get("/autocomplete/tags?q=AIR")
+        assert query_counter.count == start
+        # Both spellings, but not the hidden entry.
+        assert response.get_json()["data"] == [{"name": "air supply",
+                                                "count": 2}]
+
+
+def test_writes_keep_index_current(journal, clients):
+    """The index is kept up to date by the writes themselves (without being
+    reloaded), and matches an index loaded from the database afterwards.
+    """
+    client = clients["author"]
+    journal.current_tag_index()
+    response = client.post("/entries/new", data=dict(
+        ENTRY, title="Cloud", tags="cloud, Air Supply"))
+    assert response.status_code == 302
+    with journal.models.DATABASE.connection_context():
+        entry_id = journal.models.Entry.get(
+            journal.models.Entry.title == "Cloud").id
+    for data in [dict(ENTRY, tags="cloud, rain", hidden="y"),
+                 dict(ENTRY, tags="cloud, sun")]:
+        response = client.post(f"/entries/{entry_id}/edit", data=data)
+        assert response.status_code == 302
+    assert journal.tag_index.version == journal.data_version.value
+    maintained = journal.tag_index.top(1000)
+    assert ("sun", 1) in maintained and ("rain", 1) not in [
+        (name, count) for name, count in maintained]
+    journal.tag_index.loaded = False
+    with journal.models.DATABASE.connection_context():
+        assert journal.current_tag_index().top(1000) == maintained
+    client.post(f"/entries/{entry_id}/delete")
+    assert "sun" not in dict(journal.tag_index.top(1000))
+
+
+def test_rolled_back_write_leaves_index_alone(journal, clients):
+    with journal.models.DATABASE.connection_context():
+        journal.current_tag_index()
+        user = journal.models.User.get(
+            journal.models.User.username == "tip_of_the_day")
+
+        def failing_write():
+            journal.add_entry(dict(ENTRY, user=user, tags="rolled back"))
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            journal.write(failing_write)
+        assert journal.tag_index.complete("rolled", 10) == []
+        assert not journal.models.Tag.select().where(
+            journal.models.Tag.name == "rolled back").exists()
+
+
+def test_tag_cloud(clients):
+    page = clients["anonymous"].get("/tags").get_data(as_text=True)
+    assert 'href="/tags/air%20supply" title="2 entries"' in page
+    # Hidden entries aren't counted.
+    assert 'href="/tags/Druidia" title="1 entry"' in page
@@ -0,0 +1,118 @@
+"""Tests of the write queue of the Learning Journal app."""
+
+import contextlib
+import threading
+
+import bcrypt
+import pytest
+
+import writes
+from tests.data import ENTRY
+
+
+@pytest.fixture
+def write_queue(journal):
+    """Turns the app's write queue on for the test."""
+    journal.write_queue = writes.WriteQueue(journal.models.DATABASE)
+    yield journal.write_queue
+    journal.write_queue.stop()
+    journal.write_queue = None
+
+
+@contextlib.contextmanager
+def writer_busy(write_queue):
+    """Keeps the writer busy with a job until the block ends, so that the jobs
+    queued in the block are committed together.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    write_queue.submit(block)
+    started.wait()
+    try:
+        yield
+    finally:
+        release.set()
+
+
+def add_tag(models, name: str):
+    """Write job which creates a tag."""
+    return models.Tag.create(name=name, key=name)
+
+
+def test_jobs_are_committed_in_batches(journal, write_queue):
+    models = journal.models
+    with writer_busy(write_queue):
+        batches = write_queue.batches
+        pending = [write_queue.submit(add_tag, models, f"batch {number}")
+                   for number in range(5)]
+    tags = [future.result() for future in pending]
+    # One batch for the busy job, and one for the rest.
+    assert write_queue.batches == batches + 2
+    with models.DATABASE.connection_context():
+        assert (models.Tag.select()
+                .where(models.Tag.id.in_([tag.id for tag in tags]))
+                .count() == 5)
+        models.Tag.delete().where(models.Tag.name.startswith("batch ")).execute()
+
+
+def test_failing_job_does_not_undo_others(journal, write_queue):
+    models = journal.models
+    with writer_busy(write_queue):
+        first = write_queue.submit(add_tag, models, "unique")
+        # (The names of tags are unique.)
+        second = write_queue.submit(add_tag, models, "unique")
+        third = write_queue.submit(add_tag, models, "other")
+    assert first.result().name == "unique"
+    with pytest.raises(models.IntegrityError):
+        second.result()
+    assert third.result().name == "other"
+    with models.DATABASE.connection_context():
+        assert models.Tag.select().where(
+            models.Tag.name.in_(["unique", "other"])).count() == 2
+        models.Tag.delete().where(
+            models.Tag.name.in_(["unique", "other"])).execute()
+
+
+def test_routes_write_through_queue(journal, clients, write_queue):
+    client = clients["author"]
+    batches = write_queue.batches
+    response = client.post("/entries/new", data=dict(ENTRY, title="Queued"))
+    assert response.status_code == 302
+    with journal.models.DATABASE.connection_context():
+        entry_id = journal.models.Entry.get(
+            journal.models.Entry.title == "Queued").id
+    response = client.post(f"/entries/{entry_id}/edit",
+                           data=dict(ENTRY, title="Queued", tags="success"))
+    assert response.status_code == 302
+    assert "success" in client.get(f"/entries/{entry_id}").get_data(
+        as_text=True)
+    response = client.post(f"/entries/{entry_id}/delete")
+    assert response.status_code == 302
+    assert write_queue.batches == batches + 3
+    with journal.models.DATABASE.connection_context():
+        assert not journal.models.Entry.select().where(
+            journal.models.Entry.id == entry_id).exists()
+
+
+def test_login_rehash_goes_through_queue(journal, write_queue):
+    """A password hashed at an old bcrypt cost is saved rehashed by the
+    writer.
+    """
+    models = journal.models
+    old_hash = bcrypt.hashpw(b"rehash me", bcrypt.gensalt(5)).decode()
+    with models.DATABASE.connection_context():
+        models.User.add_user("rehashed", old_hash, False)
+    batches = write_queue.batches
+    response = journal.app.test_client().post("/login", data={
+        "username": "rehashed", "password": "rehash me"})
+    assert response.status_code == 302
+    assert write_queue.batches == batches + 1
+    with models.DATABASE.connection_context():
+        new_hash = models.User.get(models.User.username == "rehashed").password
+    assert new_hash != old_hash
+    assert new_hash.startswith("$2b$04$")
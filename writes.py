@@ -0,0 +1,122 @@
+"""Write queue module for the Learning Journal app.
+
+SQLite lets only one connection write at a time, so request threads which save
+entries at once queue up for the database's write lock, and under enough load
+some give up with "database is locked".  A WriteQueue runs the writes (jobs:
+functions which write to the database) in a single writer thread instead.  The
+writer takes every job waiting in the queue (up to WRITE_BATCH of them) and
+runs them in one transaction, each in its own savepoint so that a failing job
+doesn't undo the others, and commits them together.  Each job's caller waits
+on a future for its result, which is set once its transaction is committed.
+
+Reads don't go through the queue, and (in write-ahead-log mode) aren't blocked
+by the writer.  Each worker process has its own writer, and the writers of
+different processes still take turns at the write lock, but then only one
+thread per process waits for it.
+"""
+
+from concurrent import futures
+import os
+import queue
+import threading
+
+# Most jobs committed in one transaction (JOURNAL_WRITE_BATCH).  Bigger
+# batches mean fewer commits under load, but if a batch's transaction fails
+# (e.g. can't get the write lock), every job in it fails.
+WRITE_BATCH = int(os.environ.get("JOURNAL_WRITE_BATCH", 64))
+
+
+class WriteQueue:
+    """A queue of write jobs, run by a single writer thread."""
+
+    def __init__(self, database, batch_size: int = WRITE_BATCH):
+        self.database = database
+        self.batch_size = batch_size
+        self.batches = 0
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, job, *args) -> futures.Future:
+        """Queues the job (to be called with the arguments), and returns a
+        future for its result.
+        """
+        future = futures.Future()
+        self._start()
+        self._jobs.put((future, job, args))
+        return future
+
+    def run(self, job, *args):
+        """Runs the job in the writer thread, and returns its result (or
+        raises its exception) once it's committed.
+        """
+        return self.submit(job, *args).result()
+
+    def stop(self) -> None:
+        """Stops the writer thread, once the jobs already queued have run."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._jobs.put(None)
+            self._thread = None
+        thread.join()
+
+    def _start(self) -> None:
+        """Starts the writer thread, if it isn't running in this process (a
+        forked worker process doesn't inherit its parent's threads).
+        """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._jobs = queue.SimpleQueue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._write,
+                                            name="journal-writer", daemon=True)
+            self._thread.start()
+
+    def _write(self) -> None:
+        """Runs batches of jobs until stopped."""
+        jobs = self._jobs
+        stopping = False
+        while not stopping:
+            batch = [jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch.remove(None)
+                stopping = True
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch: list) -> None:
+        """Runs a batch of jobs in one transaction, and sets their futures."""
+        results = []
+        try:
+            with self.database.connection_context():
+                # Take the write lock up front, rather than when the first
+                # job first writes.
+                with self.database.transaction(lock_type="IMMEDIATE"):
+                    for future, job, args in batch:
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            with self.database.atomic():
+                                results.append((future, job(*args)))
+                        except Exception as error:
+                            future.set_exception(error)
+        except Exception as error:
+            # Nothing was committed.
+            for future, _ in results:
+                future.set_exception(error)
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        for future, result in results:
+            future.set_result(result)
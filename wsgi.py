@@ -0,0 +1,18 @@
+"""WSGI entry point for serving the Learning Journal app in production.
+
+Any WSGI server can serve "wsgi:application" with as many worker processes and
+threads as needed, e.g.:
+
+    gunicorn --workers 4 --threads 8 --bind 0.0.0.0:8000 wsgi:application
+
+Each worker process keeps its own pool of database connections (see
+models.py), which needs a connection for each of the worker's threads:  set
+JOURNAL_MAX_CONNECTIONS (8 by default) to at least the number of threads.
+Every worker shares the database, the secret key (JOURNAL_SECRET_KEY, or the
+generated secret key file) and the data version file, so they should all run
+from the same directory (or with the same JOURNAL_* environment variables).
+"""
+
+from app import create_app
+
+application = create_app()